@@ -0,0 +1,116 @@
+import ctypes
+import ctypes.util
+import os
+import socket
+import sys
+
+# batched datagram receive and send
+# packets are received into buffers allocated once and sent to many addresses with one
+# sendmmsg call on Linux, other platforms fall back to one sendto per address
+
+# receives up to len(buffers) datagrams every time it is asked
+class ReceiveBatch:
+    def __init__(self, count, size=4096):
+        self.buffers = [bytearray(size) for i in range(count)]
+        self.views = [memoryview(buffer) for buffer in self.buffers]
+
+    # receive until nothing is waiting on sock (which must be non-blocking) or every buffer is used
+    # returns [(packet, addr)] where packet is a memoryview into a buffer
+    # that is only good until the next call
+    def receive(self, sock):
+        received = list()
+        for view in self.views:
+            try:
+                size, addr = sock.recvfrom_into(view)
+            except BlockingIOError:
+                break
+            received.append((view[:size], addr))
+        return received
+
+# struct iovec, sockaddr_in, msghdr and mmsghdr from the Linux headers
+class _IOVec(ctypes.Structure):
+    _fields_ = [("base", ctypes.c_void_p), ("len", ctypes.c_size_t)]
+
+class _SockAddrIn(ctypes.Structure):
+    _fields_ = [("family", ctypes.c_ushort), ("port", ctypes.c_ubyte * 2), ("addr", ctypes.c_ubyte * 4), ("zero", ctypes.c_ubyte * 8)]
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [("name", ctypes.c_void_p), ("nameLen", ctypes.c_uint32),
+                ("iov", ctypes.POINTER(_IOVec)), ("iovLen", ctypes.c_size_t),
+                ("control", ctypes.c_void_p), ("controlLen", ctypes.c_size_t), ("flags", ctypes.c_int)]
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("hdr", _MsgHdr), ("len", ctypes.c_uint)]
+
+def _loadSendmmsg():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        sendmmsg = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return sendmmsg
+
+_sendmmsg = _loadSendmmsg()
+
+# sends one packet to many addresses
+class SendBatch:
+    def __init__(self, sock):
+        self.sock = sock
+        self.messages = dict() # {(addr, ...): (mmsghdr array, iovec, sockaddrs)} for address lists seen
+
+    # send packet to every (ip string, port) in addrs
+    def sendToAll(self, packet, addrs):
+        if not addrs:
+            return
+        if _sendmmsg is None or len(addrs) == 1:
+            for addr in addrs:
+                self.sock.sendto(packet, addr)
+            return
+
+        messages, iov, names = self._messages(tuple(addrs))
+
+        # every message points at the same iovec so only it needs to change
+        data = (ctypes.c_char * len(packet)).from_buffer_copy(packet)
+        iov.base = ctypes.addressof(data)
+        iov.len = len(packet)
+
+        sent = 0
+        while sent < len(addrs):
+            start = ctypes.addressof(messages) + sent * ctypes.sizeof(_MMsgHdr)
+            count = _sendmmsg(self.sock.fileno(), start, len(addrs) - sent, 0)
+            if count < 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno))
+            sent += count
+
+    # mmsghdr array for a list of addresses, kept for the next time the same list is sent to
+    def _messages(self, addrs):
+        found = self.messages.get(addrs)
+        if found is not None:
+            return found
+
+        if len(self.messages) >= 64:
+            self.messages.clear()
+
+        iov = _IOVec()
+        names = (_SockAddrIn * len(addrs))()
+        messages = (_MMsgHdr * len(addrs))()
+
+        for i, (ip, port) in enumerate(addrs):
+            names[i].family = socket.AF_INET
+            names[i].port[:] = port.to_bytes(2, 'big')
+            names[i].addr[:] = socket.inet_aton(ip)
+
+            hdr = messages[i].hdr
+            hdr.name = ctypes.addressof(names[i])
+            hdr.nameLen = ctypes.sizeof(_SockAddrIn)
+            hdr.iov = ctypes.pointer(iov)
+            hdr.iovLen = 1
+
+        found = (messages, iov, names)
+        self.messages[addrs] = found
+        return found
@@ -0,0 +1,88 @@
+import random
+
+# bidirectional forwarding detection (like RFC 5880 in asynchronous mode) between neighbors
+# each side sends BFD packets every few tens of milliseconds and the session goes down
+# when nothing comes in for detectMult of the other side's intervals
+
+# session states as sent in packets
+DOWN = 1
+INIT = 2
+UP = 3
+
+# interval used before the other side has said what it wants
+SLOW_INTERVAL = 1.0
+
+class BfdSession:
+    # interval is the seconds this side wants between packets both ways
+    def __init__(self, neighbor, interval, multiplier):
+        self.neighbor = neighbor
+        self.state = DOWN
+        self.desiredTx = interval
+        self.requiredRx = interval
+        self.multiplier = multiplier
+
+        # what the other side last sent
+        self.remoteDesiredTx = SLOW_INTERVAL
+        self.remoteRequiredRx = SLOW_INTERVAL
+        self.remoteMultiplier = multiplier
+
+        self.lastRecieved = None # time.monotonic() of the last packet from the other side
+        self.wasUp = False # the session has been up at least once
+        self.txTimer = None # next send in the emulator's timer heap
+        self.checkTimer = None # pending detection check in the emulator's timer heap
+
+    # interval to send at and put in packets
+    # sessions that are not up only send every SLOW_INTERVAL so dead neighbors are not flooded
+    # and say so so the other side does not time out waiting for them
+    def advertisedTx(self):
+        if self.state != UP:
+            return max(self.desiredTx, SLOW_INTERVAL)
+        return self.desiredTx
+
+    # seconds to wait before sending the next packet
+    # jittered to 75-100% of the interval so sessions do not line up
+    def txInterval(self):
+        return max(self.advertisedTx(), self.remoteRequiredRx) * random.uniform(0.75, 1.0)
+
+    # seconds without a packet before the session goes down
+    def detectTime(self):
+        return self.remoteMultiplier * max(self.requiredRx, self.remoteDesiredTx)
+
+    # time the session times out or None if it is down
+    def deadline(self):
+        if self.state == DOWN or self.lastRecieved is None:
+            return None
+        return self.lastRecieved + self.detectTime()
+
+    # handle a packet from the other side, intervals are in seconds
+    # returns the state before the packet
+    def recieve(self, state, multiplier, desiredTx, requiredRx, now):
+        old = self.state
+        self.lastRecieved = now
+        self.remoteMultiplier = max(1, multiplier)
+        self.remoteDesiredTx = desiredTx
+        self.remoteRequiredRx = requiredRx
+
+        if self.state == DOWN:
+            if state == DOWN:
+                self.state = INIT
+            elif state == INIT:
+                self.state = UP
+        elif self.state == INIT:
+            if state == INIT or state == UP:
+                self.state = UP
+        elif state == DOWN:
+            self.state = DOWN # other side lost us
+
+        if self.state == UP:
+            self.wasUp = True
+        return old
+
+    # take the session down if nothing came in within the detection time
+    # returns the state before the check
+    def expire(self, now):
+        old = self.state
+        deadline = self.deadline()
+        if deadline is not None and deadline <= now:
+            self.state = DOWN
+        return old
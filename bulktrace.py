@@ -0,0 +1,240 @@
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import random
+import socket
+import sys
+import traceback
+from time import monotonic
+
+import nodes
+import packets
+import resolver
+import snapshot
+
+# route trace of many source and destination pairs from one process
+# every probe of every trace goes out of one socket and the emulators send the probe id back
+# in their reply (see trace.py) so replies are matched to their trace and hop with a dictionary
+# results are written out a line at a time as each trace finishes
+
+parser = argparse.ArgumentParser(description="Bulk Route Trace")
+
+parser.add_argument("-a", "--routetrace_port", type=int, required=True, dest="rtPort")
+parser.add_argument("-p", "--pairs", type=str, default=None, dest="pairsName") # lines of srcHost srcPort destHost destPort
+parser.add_argument("-f", "--filename", type=str, default=None, dest="fileName") # topology file or snapshot to trace every pair of
+parser.add_argument("-o", "--output", type=str, default=None, dest="outName") # default is stdout
+parser.add_argument("-F", "--format", type=str, default="csv", choices=("csv", "jsonl"), dest="format")
+parser.add_argument("-j", "--jobs", type=int, default=64, dest="jobs") # traces running at once
+parser.add_argument("-w", "--window", type=int, default=4, dest="window") # probes out at once for each trace
+parser.add_argument("-t", "--timeout", type=float, default=1.0, dest="timeout") # seconds to wait for each probe
+parser.add_argument("-r", "--retries", type=int, default=2, dest="retries") # times a probe is sent again before giving up on its hop
+parser.add_argument("-H", "--hosts", type=str, default=None, dest="hostsName") # hosts style file to resolve names from
+
+args = parser.parse_args()
+
+# check arguments
+if 2049 > args.rtPort or args.rtPort > 65536:
+    print("Routetrace port out of range.")
+    sys.exit()
+if (args.pairsName is None) == (args.fileName is None):
+    print("Give either a pairs file or a topology file.")
+    sys.exit()
+if args.jobs < 1 or args.window < 1:
+    print("Jobs and window must be at least 1.")
+    sys.exit()
+
+maxHops = 20 # at most 20 nodes
+
+CSV_FIELDS = ("src", "dest", "reached", "hops", "rtt_ms", "path")
+
+# lines of a pairs file resolved at a time
+PAIRS_CHUNK = 1024
+
+# (src node id, dest node id) of every line of a pairs file, an async generator
+# the file is read a chunk at a time as traces need more pairs so big files are never all in memory
+# it is opened here so a missing file is found before any trace starts
+def readPairs(fileName):
+    return _pairLines(fileName, open(fileName, 'r'))
+
+async def _pairLines(fileName, pairsFile):
+    loop = asyncio.get_running_loop()
+    with pairsFile:
+        lines = enumerate(pairsFile, 1)
+        while True:
+            block = list(itertools.islice(lines, PAIRS_CHUNK))
+            if not block:
+                return
+
+            chunk = list()
+            for lineNo, line in block:
+                vals = line.split('#', 1)[0].split()
+                if not vals:
+                    continue
+                if len(vals) != 4:
+                    raise ValueError(f"{fileName} line {lineNo}: expected srcHost srcPort destHost destPort")
+                chunk.append(vals)
+
+            # look every name in the chunk up once, all at the same time
+            # off the event loop so probes already out are not held up by the lookups
+            addrs = await loop.run_in_executor(None, resolver.resolveAll, [vals[i] for vals in chunk for i in (0, 2)])
+            for vals in chunk:
+                yield (nodes.internNode(addrs[vals[0]], int(vals[1])), nodes.internNode(addrs[vals[2]], int(vals[3])))
+
+# (src node id, dest node id) of every pair of nodes with a line in a topology file, an async generator
+def topologyPairs(fileName):
+    emulators = [node for node, links in snapshot.readTopologyLinks(fileName)]
+    return _iterate(itertools.permutations(emulators, 2))
+
+async def _iterate(iterable):
+    for item in iterable:
+        yield item
+
+# replies coming in on the one socket are handed to the probe waiting for them
+class TraceProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.transport = None
+        self.waiting = dict() # {probeId: future of (responder node id, time recieved)}
+        self.nextProbeId = random.getrandbits(32)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < packets.ROUTE_TRACE.size or data[0] != 79: # 'O'
+            return
+        future = self.waiting.pop(packets.routeTraceProbe(data), None)
+        if future is not None and not future.done():
+            future.set_result((nodes.nodeId(*packets.ADDRESS.unpack_from(data, packets.SRC_OFFSET)), monotonic()))
+
+    def error_received(self, exc):
+        pass # a probe to an emulator that is not there, it will time out
+
+    # new probe id and the future its reply is handed to
+    def newProbe(self):
+        probeId = self.nextProbeId
+        self.nextProbeId = (self.nextProbeId + 1) & 0xFFFFFFFF
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[probeId] = future
+        return (probeId, future)
+
+    def forget(self, probeId):
+        self.waiting.pop(probeId, None)
+
+# (responder node id, rtt in seconds) of the hop tTL from src towards dest or None if it never answered
+async def probe(protocol, hostKey, src, dest, tTL):
+    # route trace packet format: type 1B, srcIP 4B, srcPort 2B, destIP 4B, destPort 2B, senderIP 4B, senderPort 2B, TTL 4B, probeId 4B
+    rTPacket = bytearray(packets.ROUTE_TRACE.pack(ord('T'), *nodes.splitNode(src), *nodes.splitNode(dest), *nodes.splitNode(hostKey), tTL) + packets.PROBE.pack(0))
+
+    for tries in range(args.retries + 1):
+        probeId, future = protocol.newProbe()
+        packets.rewriteRouteTraceProbe(rTPacket, probeId)
+        sent = monotonic()
+        protocol.transport.sendto(rTPacket, nodes.sockaddr(src))
+        try:
+            responder, recieved = await asyncio.wait_for(future, args.timeout)
+            return (responder, recieved - sent)
+        except asyncio.TimeoutError:
+            protocol.forget(probeId)
+    return None
+
+# trace src to dest a window of hops at a time until dest answers
+# gives up when no hop in a whole window answers
+# returns [(responder node id, rtt in seconds) or None] of every hop up to dest
+async def trace(protocol, hostKey, src, dest):
+    hops = list()
+    while len(hops) < maxHops:
+        window = range(len(hops), min(len(hops) + args.window, maxHops))
+        replies = await asyncio.gather(*(probe(protocol, hostKey, src, dest, tTL) for tTL in window))
+
+        for reply in replies:
+            hops.append(reply)
+            if reply is not None and reply[0] == dest:
+                return hops
+        if not any(replies):
+            break
+    return hops
+
+# result of a trace as a dict ready to be written out
+def result(src, dest, hops):
+    reached = bool(hops) and hops[-1] is not None and hops[-1][0] == dest
+    return {
+        "src": nodes.nodeName(src),
+        "dest": nodes.nodeName(dest),
+        "reached": reached,
+        "hops": len(hops) if reached else None,
+        "rtt_ms": round(hops[-1][1] * 1000, 3) if reached else None,
+        "path": [nodes.nodeName(hop[0]) if hop is not None else "*" for hop in hops],
+    }
+
+# writes a result a line at a time and flushes so results can be read while the audit runs
+class ResultWriter:
+    def __init__(self, outFile, format):
+        self.outFile = outFile
+        self.format = format
+        if format == "csv":
+            self.writer = csv.writer(outFile)
+            self.writer.writerow(CSV_FIELDS)
+
+    def write(self, row):
+        if self.format == "csv":
+            self.writer.writerow([" ".join(row[field]) if field == "path" else row[field] for field in CSV_FIELDS])
+        else:
+            self.outFile.write(json.dumps(row) + "\n")
+        self.outFile.flush()
+
+async def bulktrace(pairs, hostKey, writer):
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(TraceProtocol, local_addr=nodes.sockaddr(hostKey))
+
+    # a job takes the next pair off the shared generator every time it finishes a trace
+    # so only as many pairs as there are jobs are ever taken out of it
+    # one job at a time may wait on the generator (it can be resolving the next chunk)
+    nextPair = asyncio.Lock()
+
+    async def job():
+        while True:
+            async with nextPair:
+                pair = await anext(pairs, None)
+            if pair is None:
+                return
+            src, dest = pair
+            hops = await trace(protocol, hostKey, src, dest)
+            writer.write(result(src, dest, hops))
+
+    try:
+        await asyncio.gather(*(job() for i in range(args.jobs)))
+    finally:
+        transport.close()
+
+def main():
+    try:
+        if args.hostsName is not None:
+            resolver.loadHosts(args.hostsName)
+        hostKey = nodes.internNode(resolver.resolve(socket.gethostname()), args.rtPort)
+        if args.pairsName is not None:
+            pairs = readPairs(args.pairsName)
+        else:
+            pairs = topologyPairs(args.fileName)
+    except FileNotFoundError as e:
+        print(f"File {e.filename} not found")
+        sys.exit()
+    except:
+        print(traceback.format_exc())
+        sys.exit()
+
+    outFile = sys.stdout if args.outName is None else open(args.outName, 'w', newline='')
+    try:
+        asyncio.run(bulktrace(pairs, hostKey, ResultWriter(outFile, args.format)))
+    except KeyboardInterrupt:
+        pass
+    except (OSError, ValueError) as e:
+        # from a line of the pairs file read while tracing
+        print(e)
+    finally:
+        if outFile is not sys.stdout:
+            outFile.close()
+
+if __name__ == '__main__':
+    main()
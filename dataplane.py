@@ -0,0 +1,75 @@
+import os
+import selectors
+import socket
+import traceback
+
+import batchio
+import nodes
+import packets
+
+# forwarding workers for the emulator
+# every worker has its own socket bound to the emulator port with SO_REUSEPORT so the kernel
+# spreads incoming packets over them
+# network traffic is forwarded by the worker with the shared forwarding table (fib.py)
+# everything else (hello, link state and route trace) is handed to the control process
+
+# True if this platform can run forwarding workers
+def supported():
+    return hasattr(socket, 'SO_REUSEPORT') and hasattr(os, 'fork')
+
+# socket bound to addr that shares the port with the other workers
+def workerSocket(addr):
+    soc = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    soc.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    soc.bind(addr)
+    soc.setblocking(0)
+    return soc
+
+# run a worker until the control process exits
+# recSoc is from workerSocket, controlSoc is this end of a datagram socketpair to the control process
+def runWorker(recSoc, controlSoc, table, batchSize, hashSeed):
+    parent = os.getppid()
+    sendSoc = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    recieveBatch = batchio.ReceiveBatch(max(1, batchSize))
+    controlSoc.setblocking(0)
+
+    selector = selectors.DefaultSelector()
+    selector.register(recSoc, selectors.EVENT_READ)
+
+    while os.getppid() == parent:
+        try:
+            if not selector.select(1.0):
+                continue
+
+            recieved = recieveBatch.receive(recSoc)
+            table.refresh()
+
+            # hand control packets over first so they never wait behind network traffic
+            for data, addr in recieved:
+                if data[0] >= 4:
+                    try:
+                        controlSoc.send(data)
+                    except BlockingIOError:
+                        pass # control process is behind, drop it like a full socket would
+
+            for data, addr in recieved:
+                if data[0] < 4:
+                    forwardData(sendSoc, table, data, hashSeed)
+
+        except KeyboardInterrupt:
+            break
+        except:
+            print("Something went wrong when forwarding packets.")
+            print(traceback.format_exc())
+
+# send network traffic to its next hop
+# hashSeed is packets.hashSeed of the host so equal cost paths are picked like the control process does
+def forwardData(sendSoc, table, data, hashSeed):
+    destIP, destPort = packets.ADDRESS.unpack_from(data, packets.DEST_OFFSET)
+    destKey = nodes.nodeId(destIP, destPort)
+
+    nextHops = table.nextHops(destKey)
+    if nextHops == None:
+        print(f"NO PATH FOUND TO {nodes.nodeName(destKey)}")
+        return
+    sendSoc.sendto(data, nodes.sockaddr(packets.pickNextHop(data, nextHops, hashSeed)))
@@ -1,19 +1,50 @@
 import argparse
+import os
 import sys
 import socket
 import traceback
-import ipaddress
-from datetime import datetime, timedelta
-import pickle
-import copy
-import bisect
+import selectors
+import signal
+
+import bfd
+import dataplane
+import fib
+import fibdelta
+import hosts
+import ingress
+import linkstate
+import metrics
+import nodes
+import packets
+import spf
+import timers
+import topologystore
+
+# command line, address, clock, topology file and sockets come from host (see hosts.py)
+# the simulator (simulator.py) loads this file once for every virtual node with host already set
+host = globals().get("host") or hosts.Host()
+monotonic = host.monotonic
+wallTime = host.wallTime
 
 parser = argparse.ArgumentParser(description="Link State Routing Emulator")
 
 parser.add_argument("-p", "--port", type=int, required=True, dest="port")
 parser.add_argument("-f", "--filename", type=str, required=True, dest="fileName")
-
-args = parser.parse_args()
+parser.add_argument("-c", "--compiled_from", type=str, default=None, dest="sourceName") # text file a snapshot given to -f was compiled from, a stale snapshot is refused
+parser.add_argument("-b", "--batch_size", type=int, default=64, dest="batchSize") # packets recieved per wakeup
+parser.add_argument("-q", "--queue_size", type=int, default=1000, dest="queueSize") # packets kept waiting for each packet class
+parser.add_argument("-s", "--schedule", choices=["strict", "weighted"], default="strict", dest="schedule") # order packet classes are handled in
+parser.add_argument("-m", "--ecmp", action="store_true", dest="ecmp") # spread flows over equal cost paths
+parser.add_argument("-a", "--lfa", action="store_true", dest="lfa") # keep loop free alternates to switch to when a next hop goes down
+parser.add_argument("-d", "--bfd_interval", type=int, default=0, dest="bfdInterval") # milliseconds between bfd packets to each neighbor (0 turns bfd off)
+parser.add_argument("-x", "--bfd_multiplier", type=int, default=3, dest="bfdMultiplier") # bfd intervals without a packet before a neighbor is down
+parser.add_argument("-w", "--workers", type=int, default=0, dest="workers") # forwarding worker processes (0 forwards everything here)
+parser.add_argument("-t", "--print_tables", action="store_true", dest="printTables") # print topology and forwarding table every time they change
+parser.add_argument("-M", "--metrics_file", type=str, default=None, dest="metricsFile") # write metrics in the prometheus text format here every few seconds
+parser.add_argument("-S", "--stats_socket", type=str, default=None, dest="statsSocket") # unix datagram socket answering any request with the metrics
+parser.add_argument("-D", "--fib_deltas", type=str, default=None, dest="fibDeltas") # send forwarding table changes to - (stdout), unix:<path> or a file, SIGUSR1 sends the whole table
+
+args = parser.parse_args(host.argv)
 
 # check port numbers
 if 2049 > args.port or args.port > 65536:
@@ -21,107 +52,260 @@ if 2049 > args.port or args.port > 65536:
     sys.exit()
 
 # open port (to listen on only?)
-hostname = socket.gethostname()
-ipAddr = socket.gethostbyname(hostname)
+ipAddr = host.ipAddr()
 
 reqAddr = (ipAddr, args.port)
-hostKey = (ipaddress.ip_address(ipAddr), int(args.port))
+hostKey = nodes.internNode(ipAddr, int(args.port))
+hashSeed = packets.hashSeed(hostKey) # equal cost paths are picked differently from other routers
+
+if args.workers > 0 and not dataplane.supported():
+    print("Forwarding workers need SO_REUSEPORT and fork, forwarding everything here instead.")
+    args.workers = 0
 
 # open socket
+# with workers they all share the port and pass everything but network traffic to recSoc
+# workerSocs are the sockets bound to the port, one for each worker
 try:
-    recSoc = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    recSoc.bind(reqAddr)
-    recSoc.setblocking(0)
+    recSoc, controlSoc, workerSocs = host.bind(reqAddr, args.workers)
 except:
     print("An error occured binding the socket")
     print(traceback.format_exc())
     sys.exit()
 
 # socket to send from (not the same one)
-sendSoc = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+# and send floods to all neighbors with one call
+sendSoc, sendBatch = host.senders()
 
-# global variables
-topology = dict() # dictionary of immediate links between nodes
-topologyRef = dict() # keep dictionary of initial links between nodes
+# socket metrics are asked for on
+statsSoc = None
+if args.statsSocket is not None:
+    try:
+        statsSoc = metrics.statsSocket(args.statsSocket)
+    except:
+        print("An error occured binding the stats socket")
+        print(traceback.format_exc())
+        sys.exit()
 
-nodesLocationDict = dict() # keep ordered list of destinations (excluding self)
-largestSeqNo = list() # largest sequence number for each node
-isUp = list() # list of whether nodes are up or down
+# forwarding table changes go to the subscriber
+fibPublisher = None # fibdelta.DeltaPublisher
+if args.fibDeltas is not None:
+    try:
+        fibPublisher = fibdelta.DeltaPublisher(fibdelta.openSubscriber(args.fibDeltas))
+    except:
+        print("An error occured opening the forwarding table subscriber")
+        print(traceback.format_exc())
+        sys.exit()
 
-neighborsLocationDict = dict() # doctionary of the locations of 
-latestTimestamp = list() # last time stamp a HelloMessage was recieved (from neighbors)
+# signals wake the event loop through wakeSoc, signal.set_wakeup_fd writes to the other end
+wakeSoc = None
+signalSoc = None
+fullTableRequested = False # SIGUSR1 came in and the whole table has not been sent yet
+
+# recieve up to batchSize packets per wakeup into buffers made once
+recieveBatch = host.receiveBatch(max(1, args.batchSize))
 
-forwardingTable = list() # [(dest, nextHop)]
+# recieved packets wait in a queue for their class so hellos and link states are handled first
+ingressScheduler = ingress.IngressScheduler(max(1, args.queueSize), ingress.DEFAULT_WEIGHTS if args.schedule == "weighted" else None)
+drainBatches = 16 # most batches pulled off the socket per wakeup, it is cheaper than handling them
 
-helloInterval = timedelta(milliseconds=1000)
-downInterval = timedelta(milliseconds=2100)
-linkInterval = timedelta(milliseconds=4500)
+# global variables
+# nodes are keyed by their node id (see nodes.py)
+topology = None # topologystore.TopologyStore of links between nodes with their current costs
+hostIndex = None # index of this host in topology
+topologyFile = dict() # {node: {next: cost}} of every line in the topology file
 
-lastHelloMessage = datetime.now() - timedelta(days=1)
-lastLinkStateMessage = datetime.now() - timedelta(days=1)
+# latest link state from every other node, it is flushed if it is not refreshed within maxAge
+maxAge = 20.0
+linkStates = linkstate.LinkStateDatabase(maxAge)
+agedOut = set() # nodes in the file whose link state was flushed so their file links are not assumed any more
+suppressedLinkStates = dict() # {origin node id: duplicate or old link state packets dropped}
+
+nodesLocationDict = dict() # {node: index in topology}, the same dict as topology.index
+isUp = dict() # {neighbor: whether it is up}
+
+neighborsLocationDict = dict() # doctionary of the locations of 
+latestTimestamp = list() # last time stamp a HelloMessage was recieved (from neighbors)
+neighborAddrs = list() # (ip string, port) of every neighbor in the same order as neighborsLocationDict
+bfdSessions = dict() # {neighbor: bfd.BfdSession} (only with --bfd_interval)
+
+forwardingTable = list() # [(dest, nextHop)] node ids
+equalCostTable = list() # [(nextHop, ...)] every equal cost next hop for the same indexes as forwardingTable (only with --ecmp)
+alternateTable = list() # [alternate next hop or None] for the same indexes as forwardingTable (only with --lfa)
+shortestPathTree = None # shortest path tree from this host, repaired as links change
+changedLinks = list() # [(node, next)] links changed since the forwarding table was built
+sharedForwardingTable = None # fib.SharedForwardingTable the workers forward with
+sharedTableOverflow = 0 # destinations left out of sharedForwardingTable the last time it was published
+
+# counted for the metrics (see metrics.py)
+# with workers network traffic they forward is not counted here
+packetsRecieved = metrics.typeCounts() # [packets] by type byte
+packetsSent = metrics.typeCounts()
+packetsDropped = dict() # {(type byte, reason): packets}
+linkStatesAccepted = 0 # link state packets newer than the one in linkStates
+neighborChanges = dict() # {(neighbor, "up" or "down"): times}
+spfTimes = {"full": metrics.Histogram(), "incremental": metrics.Histogram()} # seconds to build the forwarding table
+metricsRegistry = metrics.Registry()
+metricsInterval = 5.0
+
+# times are time.monotonic() seconds
+helloInterval = 1.0
+downInterval = 2.1
+linkInterval = 4.5
+
+lastHelloMessage = monotonic() - 86400 # a day ago
+lastLinkStateMessage = monotonic() - 86400
+
+# event loop waits on the socket until the next timer is due instead of polling
+selector = host.selector()
+timerHeap = timers.TimerHeap() # hello, link state and dead neighbor deadlines
+
+# topology changes ask for a new link state and forwarding table through these
+# so changes close together are sent and computed once, backing off while the topology keeps changing
+linkStateThrottle = timers.Throttle(timerHeap, lambda: sendLinkState(), 0.01, 1.0)
+forwardTableThrottle = timers.Throttle(timerHeap, lambda: buildForwardTable(), 0.01, 0.5)
 
 isListening = True
 
-lastSeqNoSent = 0
+# start from the clock so link states sent after a restart are newer than the ones sent before it
+lastSeqNoSent = int(wallTime()) & 0xFFFFFFFF
 startTTL = 15
 
 # hello packet format: type 1B, srcIP 4B, srcPort 2B
 # link state packet format: type 1B, srcIP 4B, srcPort 2B, lastSenderIP 4B, lastSenderPort 2B, seqNo 4B, TTL 4B, len 4B, data
+# link state data format: ip 4B, port 2B, cost 4B for every link (see packets.py)
 # route trace packet format: type 1B, srcIP 4B, srcPort 2B, destIP 4B, destPort 2B, senderIP 4B, senderPort 2B, TTL 4B
 
 def readtopology():
-    global topology
-    global topologyRef
-    global nodesLocationDict
-    global largestSeqNo
+    global topologyFile
     global neighborsLocationDict
     global latestTimestamp
+    global neighborAddrs
     global isUp
 
-    time = datetime.now()
+    time = monotonic()
 
     # read topology file
     try:
-        with open(args.fileName, 'r') as topologyFile:
-            lines = topologyFile.readlines()
-
-            # iterate over lines in file and add nodes to topology
-            for line in lines:
-                nodes = line.split()
-                linksToAdd = dict()
-
-                # get link values 
-                for i in range(1, len(nodes)):
-                    nodeVals = nodes[i].split(',')
-                    nodeKey = (ipaddress.ip_address(nodeVals[0]), int(nodeVals[1]))
-                    linksToAdd[nodeKey] = int(nodeVals[2])
-
-                # get dict key
-                keyVals = nodes[0].split(',')
-                key = (ipaddress.ip_address(keyVals[0]), int(keyVals[1]))
-
-                # add value to dictionary
-                topology[key] = linksToAdd
-
-                # add to nodes dict and sequence number
-                nodesLocationDict[key] = len(largestSeqNo)
-                largestSeqNo.append((key, 0))
-                isUp.append(True)
-
-    except FileNotFoundError:
-        print(f"File {args.fileName} not found")
+        topologyFile = host.readTopology(args.fileName, args.sourceName)
+        topologyFile[hostKey]
+    except FileNotFoundError as e:
+        print(f"File {e.filename} not found")
+        sys.exit()
+    except ValueError as e:
+        print(f"{args.fileName} {e}")
         sys.exit()
     except:
         print(traceback.format_exc())
         sys.exit()
 
     # get neighbor time stamps
-    for node in topology[hostKey].keys():
+    for node in topologyFile[hostKey].keys():
         neighborsLocationDict[node] = len(latestTimestamp)
         latestTimestamp.append((node, time))
+        neighborAddrs.append(nodes.sockaddr(node))
+        isUp[node] = True
+
+    rebuildTopology()
+
+# make topology from the topology file, the link state database and neighbors found at runtime
+# nodes that nothing links to any more are left out so it does not grow with nodes that went away
+# every link is set to its current cost and the shortest path tree is computed from scratch
+def rebuildTopology():
+    global topology
+    global hostIndex
+    global nodesLocationDict
+    global shortestPathTree
+    global changedLinks
+    global forwardingTable
+    global equalCostTable
+    global alternateTable
+
+    oldIds = topology.ids if topology is not None else list()
+
+    # links that are not in the file start with no cost
+    # rows of the file are shared and only copied when a link has to be added to them
+    rows = dict(topologyFile)
+    copied = set()
 
-    # make topologyRef
-    topologyRef = copy.deepcopy(topology)
+    def addLink(node, next):
+        row = rows.get(node)
+        if row is not None and next in row:
+            return
+        if node not in copied:
+            rows[node] = dict(row) if row is not None else dict()
+            copied.add(node)
+        rows[node][next] = topologystore.NO_LINK
+
+    for origin, adjacency in linkStates.adjacencies():
+        if not adjacency and origin not in rows:
+            rows[origin] = dict()
+            copied.add(origin)
+        for next in adjacency.keys():
+            addLink(origin, next)
+    for node in neighborsLocationDict.keys():
+        addLink(hostKey, node)
+
+    topology = topologystore.TopologyStore(list(rows.items()))
+    hostIndex = topology.index[hostKey]
+    nodesLocationDict = topology.index
+
+    for i in range(len(topology)):
+        node = topology.ids[i]
+        for next in topology.neighbors(i):
+            topology.setLink(i, next, linkCost(node, topology.ids[next]))
+
+    shortestPathTree = None
+    changedLinks = list()
+
+    # move forwarding table entries to the new indexes until it is built again
+    oldEntries = {entry[0]: entry for entry in forwardingTable if entry[0] is not None}
+    forwardingTable = [oldEntries.get(node, (None, None)) for node in topology.ids]
+    oldHops = dict(zip(oldIds, equalCostTable))
+    equalCostTable = [oldHops.get(node, ()) for node in topology.ids]
+    alternateTable = list() # computed again with the forwarding table
+
+# cost of the link from node to next to route with or sys.maxsize if it is down
+# a link is only used when both ends say it is up
+def linkCost(node, next):
+    cost = advertisedCost(node, next)
+    if cost == sys.maxsize or advertisedCost(next, node) == sys.maxsize:
+        return sys.maxsize
+    return cost
+
+# cost node says its link to next has or sys.maxsize if it says it is down
+# this host knows its links from the file and helloMessages
+# other nodes are assumed to be as in the file until their first link state
+def advertisedCost(node, next):
+    if node == hostKey:
+        if not isUp.get(next, False):
+            return sys.maxsize
+        cost = topologyFile[hostKey].get(next)
+        if cost is None:
+            # neighbor that is not in the file, use what it says about the other way or 1
+            cost = linkStates.cost(next, node)
+            if cost is None or cost == sys.maxsize:
+                cost = 1
+        return cost
+
+    cost = linkStates.cost(node, next)
+    if cost is not None:
+        return cost
+    if node in agedOut:
+        return sys.maxsize
+    return topologyFile.get(node, {}).get(next, sys.maxsize)
+
+# set every link to and from node to the cost it should have now
+def refreshLinks(node):
+    i = topology.index.get(node)
+    if i is None:
+        return
+
+    for next in topology.neighbors(i):
+        nextKey = topology.ids[next]
+        if topology.setLink(i, next, linkCost(node, nextKey)):
+            changedLinks.append((i, next))
+        if topology.setLink(next, i, linkCost(nextKey, node)):
+            changedLinks.append((next, i))
 
 # checks type of packet
 # updates tables if needed
@@ -132,8 +316,6 @@ def handlePacket(pack, time):
     global neighborsLocationDict
     global latestTimestamp
     global isUp
-    global topology
-    global topologyRef
 
     pType = pack[0] # 'H' = helloMessage, 'L' = linkeStateMessage, 'O' = time out, 'T' = routetrace
 
@@ -141,9 +323,8 @@ def handlePacket(pack, time):
         return (78, False) # 78 = 'N' for network traffic
 
     # get sender key
-    srcIP = socket.ntohl(int.from_bytes(pack[1:5], 'big'))
-    srcPort = socket.ntohs(int.from_bytes(pack[5:7], 'big'))
-    senderKey = (ipaddress.ip_address(srcIP), srcPort)
+    srcIP, srcPort = packets.ADDRESS.unpack_from(pack, packets.SRC_OFFSET)
+    senderKey = nodes.nodeId(srcIP, srcPort)
 
 
     if pType == 72: # helloMessage
@@ -155,11 +336,14 @@ def handlePacket(pack, time):
                 latestTimestamp[neighborsLocationDict[senderKey]] = (senderKey, time)
 
             # make this link active and update topology if needed
-            if not isUp[nodesLocationDict[senderKey]]:
-                isUp[nodesLocationDict[senderKey]] = True
+            # once bfd has been up with the neighbor it decides when the neighbor is up
+            session = bfdSessions.get(senderKey)
+            if not isUp[senderKey] and (session is None or not session.wasUp or session.state == bfd.UP):
+                isUp[senderKey] = True
+                neighborChanged(senderKey, "up")
                 # I assume no link distance data is sent over helloMessage
                 # and it is assumed to be the same as the txt file described
-                addNode(senderKey)
+                refreshLinks(senderKey)
                 return (pType, True)
             else:
                 return (pType, False) # topology wasn't changed even if time was
@@ -167,168 +351,299 @@ def handlePacket(pack, time):
             # add new neighbor
             neighborsLocationDict[senderKey] = len(latestTimestamp)
             latestTimestamp.append((senderKey, time))
-            # add new node
-            nodesLocationDict[senderKey] = len(largestSeqNo)
-            largestSeqNo.append((senderKey, 0))
-            isUp.append(True)
+            neighborAddrs.append(nodes.sockaddr(senderKey))
+            isUp[senderKey] = True
+            neighborChanged(senderKey, "up")
+            watchNeighbor(senderKey)
+            # add link to new node
+            rebuildTopology()
             return (pType, True)
         
 
+    if pType == 66: # bfd packet
+        session = bfdSessions.get(senderKey)
+        if session is None:
+            return (pType, False) # not a neighbor or bfd is off
+
+        state, multiplier, desiredTx, requiredRx = packets.BFD.unpack_from(pack)[3:]
+        old = session.recieve(state, multiplier, desiredTx / 1e6, requiredRx / 1e6, time)
+
+        if old != session.state:
+            bfdStateChanged(senderKey)
+
+        # the check only has to move if the deadline came closer (the detection time got shorter)
+        deadline = session.deadline()
+        if deadline is not None and (session.checkTimer is None or deadline < session.checkTimer[0]):
+            watchBfd(senderKey)
+
+        if old == bfd.UP and session.state != bfd.UP:
+            neighborDown(senderKey, time)
+        elif session.state == bfd.UP and not isUp[senderKey]:
+            isUp[senderKey] = True
+            neighborChanged(senderKey, "up")
+            refreshLinks(senderKey)
+            return (pType, True)
+        return (pType, False)
+
     if pType == 76: # link state message
 
         # get sequence number
-        seqNo = socket.ntohl(int.from_bytes(pack[13:17], 'big'))
-        length = socket.ntohl(int.from_bytes(pack[21:25], 'big'))
-
-        # check if node exists
-        if senderKey in nodesLocationDict.keys():
-            # check if sequence number is new and update
-            if largestSeqNo[nodesLocationDict[senderKey]][1] >= seqNo:
-                return (pType, False) # seqNo was old
-            largestSeqNo[nodesLocationDict[senderKey]] = (senderKey, seqNo)
-
-            # check topology
-            newDict = pickle.loads(pack[25:25 + length])
-
-            # find what nodes to add and what noes to remove
-            toAdd = list()
-            toRemove = list()
-            changeMade = False
-
-            # check if the node is up if not add it
-            if not isUp[nodesLocationDict[senderKey]]:
-                toAdd.append(senderKey)
-                isUp[nodesLocationDict[senderKey]] = True
-                changeMade = True
-            
-            # update new topology
-            # check what differences there are
-
-            for link in topologyRef[senderKey]:
-                oldDist = topology[senderKey][link]
-                newDist = newDict[link]
-
-                # check if this link is newly reachable
-                if oldDist >= sys.maxsize / 4 and newDist < sys.maxsize / 4:
-                    toAdd.append(link)
-                    isUp[nodesLocationDict[link]] = True
-                    changeMade = True
-
-                # check if this link is newly unreachable
-                if newDist >= sys.maxsize / 4 and oldDist < sys.maxsize / 4:
-                    toRemove.append(link)
-                    isUp[nodesLocationDict[link]] = False
-                    changeMade = True
-
-            # add and remove values as needed
-            for node in toAdd:
-                addNode(node)
-
-            for node in toRemove:
-                removeNode(node)
-            
-            if changeMade:
-                return (pType, True)
-            else:
-                return (pType, False)
-        else:
-            # add new node
-            nodesLocationDict[senderKey] = len(largestSeqNo)
-            largestSeqNo.append((senderKey, seqNo))
+        # it was already checked to be newer than the one in linkStates by acceptLinkState
+        seqNo, tTL, length = packets.LINK_STATE.unpack_from(pack)[5:]
+
+        # store it and stop if only the seqNo changed
+        start = packets.LINK_STATE.size
+        if not linkStates.install(senderKey, seqNo, memoryview(pack)[start:start + length], time):
+            return (pType, False)
+        agedOut.discard(senderKey)
+
+        # check if it has nodes or links topology does not have yet
+        i = topology.index.get(senderKey)
+        if i is None:
+            rebuildTopology()
             return (pType, True)
 
+        known = set(topology.neighbors(i))
+        for next in linkStates.adjacency(senderKey).keys():
+            if topology.index.get(next) not in known:
+                rebuildTopology()
+                return (pType, True)
+
+        # update the links to and from the sender
+        refreshLinks(senderKey)
+        return (pType, True)
+
     if pType == 79 or pType == 84: # route trace packet 'O' or 'T'
         return (pType, False)
 
     return (None, False) # wrong packet
 
-# go through topology and add node
-# update forward table and send link state
-def addNode(node):
-    global isUp
-    # add node to dict
-    for next in topology[node].keys():
-        # make sure only nodes that are up are added back
-        if not isUp[nodesLocationDict[next]]:
-            continue
-        topology[node][next] = topologyRef[node][next]
-        topology[next][node] = topologyRef[next][node]
+def createroutes():
+    startTimers()
 
-    # make node up if it is in neighors
-    if node in neighborsLocationDict:
-        isUp[nodesLocationDict[node]] = True
+    selector.register(recSoc, selectors.EVENT_READ)
 
-# go through topology and remove node
-# update forward table and send link state
-def removeNode(node):
-    global isUp
-    # remove node from dict
-    for next in topology[node].keys():
-        topology[node][next] = sys.maxsize
-        topology[next][node] = sys.maxsize
-    
-    # make node not up if it is in neighors
-    if node in neighborsLocationDict:
-        isUp[nodesLocationDict[node]] = False
+    # sleep until a packet comes in or the next timer is due
+    # do not sleep while packets are waiting to be handled
+    while isListening:
+        try:
+            timeout = 0 if ingressScheduler else timerHeap.timeout(monotonic())
+            events = selector.select(timeout)
+        except KeyboardInterrupt:
+            sys.exit()
 
+        for key, mask in events:
+            if key.fileobj is recSoc:
+                recievePackets()
+            elif key.fileobj is wakeSoc:
+                handleSignals()
+            else:
+                metricsRegistry.serve(statsSoc)
+
+        # handle up to a batch of the waiting packets most important first
+        time = monotonic()
+        for data, addr in ingressScheduler.pop(max(1, args.batchSize)):
+            recievePacket(data, addr, time)
+
+        # send helloMessage, check for neighbors that have not sent helloMessage and send LinkStateMessage
+        # also builds the forwarding table and sends link state after the topology changed
+        timerHeap.runDue(monotonic())
+
+# start sending hellos and link states and watching neighbors
+def startTimers():
+    now = monotonic()
+    timerHeap.schedule(now, helloTimer)
+    timerHeap.schedule(now, linkStateTimer)
+    for key in neighborsLocationDict.keys():
+        watchNeighbor(key)
+    timerHeap.schedule(now + linkInterval, ageTimer)
+
+# move the packets waiting on the socket (up to drainBatches of batchSize) into the ingress queues
+def recievePackets():
+    try:
+        for i in range(drainBatches):
+            recieved = recieveBatch.receive(recSoc)
+            for data, addr in recieved:
+                packetsRecieved[data[0]] += 1
+                ingressScheduler.push(data, addr)
+            if len(recieved) < len(recieveBatch.views):
+                break # socket is empty
+    except KeyboardInterrupt:
+        sys.exit()
+    except:
+        print("Something went wrong when listening for packets.")
+        print(traceback.format_exc())
 
+# handle a recieved packet
+# data is a writable buffer that can be rewritten to forward it
+def recievePacket(data, addr, time):
+    try:
+        # drop link state packets that were already seen before doing anything else
+        if data[0] == 76 and not acceptLinkState(data):
+            return
 
-def createroutes():
-    global lastHelloMessage
-    global isUp
-    # check for packet
-    while isListening:
-        try:
-            # try to recieve packet and handle it
-            data, addr = recSoc.recvfrom(4096)
-            handled = handlePacket(data, datetime.now())
+        handled = handlePacket(data, time)
 
-            if handled[0] == None:
-                continue # miscleanous packet
+        if handled[0] == None:
+            return # miscleanous packet
 
-            # check if forwarding table needs to be updated
-            if handled[1]:
-                buildForwardTable()
+        # check if forwarding table needs to be updated
+        if handled[1]:
+            forwardTableThrottle.request(time)
 
-            # check if this recieved packet should be forwarded
-            if handled[0] == 76 or handled[0] == 78 or handled[0] == 79 or handled[0] == 84: # 'L', 'N', 'O', 'T'
-                forwardpacket(data, addr, handled[0])
+        # check if this recieved packet should be forwarded
+        if handled[0] == 76 or handled[0] == 78 or handled[0] == 79 or handled[0] == 84: # 'L', 'N', 'O', 'T'
+            forwardpacket(data, addr, handled[0])
 
-            # check if a new link state message needs to be created
-            if handled[0] == 72 and handled[1]:
-                sendLinkState()
+        # check if a new link state message needs to be created
+        if (handled[0] == 72 or handled[0] == 66) and handled[1]:
+            linkStateThrottle.request(time)
 
-        except BlockingIOError:
-            pass # skip down to check intervals
-        except KeyboardInterrupt:
-            sys.exit()
-        except:
-            print("Something went wrong when listening for or interacting with packet.")
-            print(traceback.format_exc())
-        
-        # send helloMessage timed
-        if lastHelloMessage <= datetime.now() - helloInterval:
-            sayHello()
-        
-        # check for neighbors that have not sent helloMessage
-        updateFTandLS = False
-        for key in neighborsLocationDict.keys():
-            i = nodesLocationDict[key]
-            j = neighborsLocationDict[key]
-            if latestTimestamp[j][1] < datetime.now() - downInterval and isUp[i]:
-                updateFTandLS = True
-                isUp[i] = False
-                
-                # update topology
-                removeNode(key)
-            
-        if updateFTandLS:
-            buildForwardTable()
-            sendLinkState()
-        
-        # send LinkStateMessage
-        if lastLinkStateMessage <= datetime.now() - linkInterval:
-            sendLinkState()
+    except KeyboardInterrupt:
+        sys.exit()
+    except:
+        print("Something went wrong when listening for or interacting with packet.")
+        print(traceback.format_exc())
+
+# flood control for link state packets
+# only reads origin and seqNo from the header so duplicates and old copies are dropped before decoding
+# returns True if the packet is newer than what linkStates has from its origin
+def acceptLinkState(pack):
+    global linkStatesAccepted
+
+    srcIP, srcPort, seqNo = packets.LINK_STATE_ORIGIN.unpack_from(pack, packets.SRC_OFFSET)
+    srcKey = nodes.nodeId(srcIP, srcPort)
+
+    known = linkStates.seqNo(srcKey)
+    if srcKey == hostKey or (known is not None and known >= seqNo):
+        # own packet flooded back or one already seen
+        suppressedLinkStates[srcKey] = suppressedLinkStates.get(srcKey, 0) + 1
+        return False
+
+    linkStatesAccepted += 1
+    return True
+
+# send helloMessage every helloInterval
+def helloTimer():
+    sayHello()
+    timerHeap.schedule(lastHelloMessage + helloInterval, helloTimer)
+
+# send LinkStateMessage if one has not been sent for linkInterval
+def linkStateTimer():
+    # same sum as the deadline below so a timer run right at it always sends
+    if lastLinkStateMessage + linkInterval <= monotonic():
+        sendLinkState()
+    timerHeap.schedule(lastLinkStateMessage + linkInterval, linkStateTimer)
+
+# flush link states that have not been refreshed within maxAge
+def ageTimer():
+    now = monotonic()
+    expired = linkStates.expire(now)
+    if expired:
+        for origin in expired:
+            if origin in topologyFile:
+                agedOut.add(origin)
+
+        # drops the nodes only they linked to
+        rebuildTopology()
+        forwardTableThrottle.request(now)
+
+    timerHeap.schedule(now + linkInterval, ageTimer)
+
+# check neighbor once downInterval has passed since its last helloMessage
+def watchNeighbor(key):
+    j = neighborsLocationDict[key]
+    timerHeap.schedule(latestTimestamp[j][1] + downInterval, checkNeighbor, key)
+    if args.bfdInterval > 0 and key not in bfdSessions:
+        startBfd(key)
+
+# take neighbor down if it has not sent a helloMessage within downInterval
+def checkNeighbor(key):
+    now = monotonic()
+    j = neighborsLocationDict[key]
+    deadline = latestTimestamp[j][1] + downInterval
+
+    if deadline <= now:
+        neighborDown(key, now)
+
+        # keep checking in case it is brought back up
+        deadline = now + downInterval
+
+    timerHeap.schedule(deadline, checkNeighbor, key)
+
+# take a neighbor that stopped answering down and update topology
+def neighborDown(key, now):
+    if not isUp[key]:
+        return
+    isUp[key] = False
+    neighborChanged(key, "down")
+
+    # update topology
+    refreshLinks(key)
+
+    # workers switch to alternates now instead of after the forwarding table is built again
+    if args.lfa:
+        publishForwardingTable()
+    forwardTableThrottle.request(now)
+    linkStateThrottle.request(now)
+
+# count a neighbor going up or down for the metrics
+def neighborChanged(key, direction):
+    neighborChanges[(key, direction)] = neighborChanges.get((key, direction), 0) + 1
+
+# count a packet that was dropped for the metrics
+def dropPacket(pType, reason):
+    packetsDropped[(pType, reason)] = packetsDropped.get((pType, reason), 0) + 1
+
+# start a bfd session with neighbor key
+def startBfd(key):
+    bfdSessions[key] = bfd.BfdSession(key, args.bfdInterval / 1000, max(1, args.bfdMultiplier))
+    sendBfd(key)
+
+# send a bfd packet to neighbor key every negotiated interval
+def sendBfd(key):
+    session = bfdSessions[key]
+    packet = packets.BFD.pack(ord('B'), *nodes.splitNode(hostKey), session.state, session.multiplier,
+                              int(session.advertisedTx() * 1e6), int(session.requiredRx * 1e6))
+    try:
+        sendSoc.sendto(packet, nodes.sockaddr(key))
+        packetsSent[66] += 1
+    except OSError:
+        pass # try again next interval
+    session.txTimer = timerHeap.schedule(monotonic() + session.txInterval(), sendBfd, key)
+
+# tell the neighbor about a new session state right away instead of at the next interval
+def bfdStateChanged(key):
+    session = bfdSessions[key]
+    if session.txTimer is not None:
+        timerHeap.cancel(session.txTimer)
+    sendBfd(key)
+
+# check the session with neighbor key when it would time out
+def watchBfd(key):
+    session = bfdSessions[key]
+    if session.checkTimer is not None:
+        timerHeap.cancel(session.checkTimer)
+        session.checkTimer = None
+
+    deadline = session.deadline()
+    if deadline is not None:
+        session.checkTimer = timerHeap.schedule(deadline, checkBfd, key)
+
+# take the neighbor down once its bfd session times out
+# runs at the session's deadline and moves itself along while packets keep coming in
+def checkBfd(key):
+    session = bfdSessions[key]
+    session.checkTimer = None
+
+    now = monotonic()
+    old = session.expire(now)
+    if old != session.state:
+        if old == bfd.UP:
+            neighborDown(key, now)
+        bfdStateChanged(key)
+
+    watchBfd(key)
 
 
 # sends hello packet to all neighbors wether they are up or not
@@ -337,17 +652,13 @@ def sayHello():
     global lastHelloMessage
 
     # make packet
-    pType = ord('H').to_bytes(1, 'big')
-    srcIP = socket.htonl(int(hostKey[0])).to_bytes(4, 'big')
-    srcPort = socket.htons(hostKey[1]).to_bytes(2, 'big')
-    packet = pType + srcIP + srcPort
+    packet = packets.HELLO.pack(ord('H'), *nodes.splitNode(hostKey))
 
     # send packets to all neighbors
-    for destKey in neighborsLocationDict.keys():
-        dest = (str(destKey[0]), destKey[1])
-        sendSoc.sendto(packet, dest)
+    sendBatch.sendToAll(packet, neighborAddrs)
+    packetsSent[72] += len(neighborAddrs)
 
-    lastHelloMessage = datetime.now()
+    lastHelloMessage = monotonic()
 
 # sends link state from this address
 # link state packet format: type 1B, srcIP 4B, srcPort 2B, lastSenderIP 4B, lastSenderPort 2B, seqNo 4B, TTL 4B, len 4B, data
@@ -356,84 +667,70 @@ def sendLinkState():
     global lastLinkStateMessage
     lastSeqNoSent += 1
     # serialize data
-    linkStateToSend = pickle.dumps(topology[hostKey])
+    # the costs this host sees, not the ones it routes with so a link both ends just saw come up is not held down
+    links = list()
+    for next in topology.neighbors(hostIndex):
+        node = topology.ids[next]
+        links.append((node, advertisedCost(hostKey, node)))
+    linkStateToSend = packets.encodeLinkState(links)
     # make packet
-    pType = ord('L').to_bytes(1, 'big')
-    srcIP = socket.htonl(int(hostKey[0])).to_bytes(4, 'big')
-    srcPort = socket.htons(hostKey[1]).to_bytes(2, 'big')
-    lastSenderIP = socket.htonl(int(hostKey[0])).to_bytes(4, 'big')
-    lastSenderPort = socket.htons(hostKey[1]).to_bytes(2, 'big')
-    seqNo = socket.htonl(lastSeqNoSent).to_bytes(4, 'big')
-    tTL = socket.htonl(startTTL).to_bytes(4, 'big')
-    length = socket.htonl(len(linkStateToSend)).to_bytes(4, 'big')
-    packet = pType + srcIP + srcPort + lastSenderIP + lastSenderPort + seqNo + tTL + length + linkStateToSend
+    hostIP, hostPort = nodes.splitNode(hostKey)
+    header = packets.LINK_STATE.pack(ord('L'), hostIP, hostPort, hostIP, hostPort, lastSeqNoSent, startTTL, len(linkStateToSend))
+    packet = header + linkStateToSend
 
     # send packets to all neighbors
-    for destKey in neighborsLocationDict.keys():
-        dest = (str(destKey[0]), destKey[1])
-        sendSoc.sendto(packet, dest)
+    sendBatch.sendToAll(packet, neighborAddrs)
+    packetsSent[76] += len(neighborAddrs)
 
-    lastLinkStateMessage = datetime.now()
+    lastLinkStateMessage = monotonic()
 
 
 def forwardpacket(data, addr, pType):
     # check packet type and what to do with it
     if pType == 78: # network traffic
         # send to next spot in forwarding table
-        destIP = socket.ntohl(int.from_bytes(data[7:11], 'big'))
-        destPort = socket.ntohs(int.from_bytes(data[11:13], 'big'))
-        destKey = (ipaddress.ip_address(destIP), destPort)
+        destIP, destPort = packets.ADDRESS.unpack_from(data, packets.DEST_OFFSET)
+        destKey = nodes.nodeId(destIP, destPort)
 
         # find next hop and send
-        nextHop = forwardingTable[nodesLocationDict[destKey]][1]
+        nextHop = nextHopTo(destKey)
         if nextHop == None:
-            print(f"NO PATH FOUND TO {destKey}")
+            print(f"NO PATH FOUND TO {nodes.nodeName(destKey)}")
+            dropPacket(data[0], "no_path")
             return
-        sendSoc.sendto(data, nextHop)
+        if args.ecmp:
+            # keep the flow on one of the equal cost paths that is up
+            nextHop = packets.pickNextHop(data, equalCostHopsTo(destKey) or (nextHop,), hashSeed)
+        sendSoc.sendto(data, nodes.sockaddr(nextHop))
+        packetsSent[data[0]] += 1
 
         return
 
     if pType == 76: # link state traffic # reliable flooding
-        # check if sequence number is old
-        srcIP = socket.ntohl(int.from_bytes(data[1:5], 'big'))
-        srcPort = socket.ntohs(int.from_bytes(data[5:7], 'big'))
-        srcKey = (ipaddress.ip_address(srcIP), srcPort)
-        seqNo = socket.ntohl(int.from_bytes(data[13:17], 'big'))
-
-        if largestSeqNo[nodesLocationDict[srcKey]][1] >= seqNo:
-            return # seqNo was old
+        # old seqNos were already dropped by acceptLinkState
+        pType, srcIP, srcPort, lastSenderIP, lastSenderPort, seqNo, oldTTL, length = packets.LINK_STATE.unpack_from(data)
 
         # check if TTL is 0
-        oldTTL = socket.ntohl(int.from_bytes(data[17:21], 'big'))
         if oldTTL == 0:
             # do I send time out packet here?
+            dropPacket(76, "ttl")
             return # do not forward this
         
         # get old values
-        lastSenderIP = socket.ntohl(int.from_bytes(data[7:11], 'big'))
-        lastSenderPort = socket.ntohs(int.from_bytes(data[11:13], 'big'))
-        lastSender = (ipaddress.ip_address(lastSenderIP), lastSenderPort)
-
-        first = data[0:7]
-        second = data[13:17]
-        third = data[21:]
+        lastSender = nodes.nodeId(lastSenderIP, lastSenderPort)
 
-        # make new values
-        newSenderIP = socket.htonl(int(hostKey[0])).to_bytes(4, 'big')
-        newSenderPort = socket.htons(hostKey[1]).to_bytes(2, 'big')
-        newTTL = socket.htonl(oldTTL - 1).to_bytes(4, 'big')
-
-        # make new packet to forward
-        forwardPacket = first + newSenderIP + newSenderPort + second + newTTL + third
+        # rewrite the recieved packet in place with this host as last sender
+        packets.rewriteLinkState(data, *nodes.splitNode(hostKey), oldTTL - 1)
 
         # forward packet to all neighbors except last sender
-        # send packets to all neighbors
-        for destKey in neighborsLocationDict.keys():
+        addrs = list()
+        for destKey, addr in zip(neighborsLocationDict.keys(), neighborAddrs):
             if destKey == lastSender:
                 continue # skip who sent the packet
+            addrs.append(addr)
 
-            dest = (str(destKey[0]), destKey[1])
-            sendSoc.sendto(forwardPacket, dest)
+        sendBatch.sendToAll(data, addrs)
+        packetsSent[76] += len(addrs)
         
         return # packets sent to neighbors
 
@@ -442,21 +739,10 @@ def forwardpacket(data, addr, pType):
         # route trace packet format: type 1B, srcIP 4B, srcPort 2B, destIP 4B, destPort 2B, senderIP 4B, senderPort 2B, TTL 4B
 
         # get destination and source addresses
-        srcIP = socket.ntohl(int.from_bytes(data[1:5], 'big'))
-        srcPort = socket.ntohs(int.from_bytes(data[5:7], 'big'))
-        srcKey = (ipaddress.ip_address(srcIP), srcPort)
-        srcRTSend = (int(ipaddress.ip_address(srcIP)), srcPort)
-
-        destIP = socket.ntohl(int.from_bytes(data[7:11], 'big'))
-        destPort = socket.ntohs(int.from_bytes(data[11:13], 'big'))
-        destKey = (ipaddress.ip_address(destIP), destPort)
-        destRTSend = (int(ipaddress.ip_address(destIP)), destPort)
-
-        senderIP = socket.ntohl(int.from_bytes(data[13:17], 'big'))
-        senderPort = socket.ntohs(int.from_bytes(data[17:19], 'big'))
-        senderSend = (senderIP, senderPort)
-
-        oldTTL = socket.ntohl(int.from_bytes(data[19:23], 'big'))
+        pType, srcIP, srcPort, destIP, destPort, senderIP, senderPort, oldTTL = packets.ROUTE_TRACE.unpack_from(data)
+        srcKey = nodes.nodeId(srcIP, srcPort)
+        destKey = nodes.nodeId(destIP, destPort)
+        senderKey = nodes.nodeId(senderIP, senderPort)
 
         # check if this is the destination address
         if destKey == hostKey:
@@ -464,37 +750,38 @@ def forwardpacket(data, addr, pType):
             if pType == 79: # 'O'
                 # send packet to route trace application
                 # no need to change packet
-                nextHop = (str(ipaddress.ip_address(senderSend[0])), senderSend[1])
-                sendSoc.sendto(data, nextHop)
+                sendSoc.sendto(data, nodes.sockaddr(senderKey))
+                packetsSent[79] += 1
                 return
             else: # 'T'
                 # check if packet should be sent back to trace immediately
                 # send 'O' packet back to src
                 if srcKey == destKey:
                     # just change packet type
-                    forwardPacket = pType = ord('O').to_bytes(1, 'big') + data[1:]
-                    nextHop = (str(ipaddress.ip_address(senderSend[0])), senderSend[1])
-                    sendSoc.sendto(forwardPacket, nextHop)
+                    data[0] = ord('O')
+                    sendSoc.sendto(data, nodes.sockaddr(senderKey))
+                    packetsSent[79] += 1
                 else:
-                    sendRouteTraceReturn(srcRTSend, senderSend)
+                    sendRouteTraceReturn(srcKey, senderKey, packets.routeTraceProbe(data))
                 return
 
         # check if TTL is 0
         if oldTTL == 0:
             # send time out message
-            sendRouteTraceReturn(srcRTSend, senderSend)
+            sendRouteTraceReturn(srcKey, senderKey, packets.routeTraceProbe(data))
             return # do not forward this
 
-        # decrememnt TTL and make new packet
-        first = data[:19]
-        forwardPacket = first + socket.htonl(oldTTL - 1).to_bytes(4, 'big')
+        # decrememnt TTL in place
+        packets.rewriteRouteTrace(data, oldTTL - 1)
 
         # send packet to next destination
-        nextHop = forwardingTable[nodesLocationDict[destKey]][1]
+        nextHop = nextHopTo(destKey)
         if nextHop == None:
-            print(f"NO PATH FOUND TO {destKey}")
+            print(f"NO PATH FOUND TO {nodes.nodeName(destKey)}")
+            dropPacket(pType, "no_path")
             return
-        sendSoc.sendto(forwardPacket, nextHop)
+        sendSoc.sendto(data, nodes.sockaddr(nextHop))
+        packetsSent[pType] += 1
 
         return
 
@@ -503,107 +790,176 @@ def forwardpacket(data, addr, pType):
 # switch oldSrc address to destination address
 # put own address into src address
 # keep sender port the same
-def sendRouteTraceReturn(destAddr, senderAddr):
+# probeId is copied over from the 'T' packet if it had one so route trace can match them up
+def sendRouteTraceReturn(destKey, senderKey, probeId=None):
     # make new values
-    pType = ord('O').to_bytes(1, 'big')
-    srcIP = socket.htonl(int(hostKey[0])).to_bytes(4, 'big')
-    srcPort = socket.htons(hostKey[1]).to_bytes(2, 'big')
-    destIP = socket.htonl(destAddr[0]).to_bytes(4, 'big')
-    destPort = socket.htons(destAddr[1]).to_bytes(2, 'big')
-    senderIP = socket.htonl(senderAddr[0]).to_bytes(4, 'big')
-    senderPort = socket.htons(senderAddr[1]).to_bytes(2, 'big')
-    tTL = socket.htonl(19).to_bytes(4, 'big') # number of possibe hops
-    rTPacket = pType + srcIP + srcPort + destIP + destPort + senderIP + senderPort + tTL
-
-    # send packet to next destination
-    destKey = (ipaddress.ip_address(destAddr[0]), destAddr[1])
+    tTL = 19 # number of possibe hops
+    rTPacket = packets.ROUTE_TRACE.pack(ord('O'), *nodes.splitNode(hostKey), *nodes.splitNode(destKey), *nodes.splitNode(senderKey), tTL)
+    if probeId is not None:
+        rTPacket += packets.PROBE.pack(probeId)
 
     # check if it should send back to sender
     if destKey == hostKey:
-        nextHop = (str(ipaddress.ip_address(senderAddr[0])), senderAddr[1])
-        sendSoc.sendto(rTPacket, nextHop)
+        sendSoc.sendto(rTPacket, nodes.sockaddr(senderKey))
+        packetsSent[79] += 1
         return
 
     # otherwise forward to next destination
-    nextHop = forwardingTable[nodesLocationDict[destKey]][1]
+    nextHop = nextHopTo(destKey)
     if nextHop == None:
-            print(f"NO PATH FOUND TO {destKey}")
+            print(f"NO PATH FOUND TO {nodes.nodeName(destKey)}")
+            dropPacket(79, "no_path")
             return
-    sendSoc.sendto(rTPacket, nextHop)
+    sendSoc.sendto(rTPacket, nodes.sockaddr(nextHop))
+    packetsSent[79] += 1
     return
 
 
+# next hop node id for destKey or None if there is no path
+# new nodes are not in the forwarding table until it is built again
+# with --lfa a next hop that went down is swapped for its alternate until then
+def nextHopTo(destKey):
+    i = nodesLocationDict.get(destKey)
+    if i is None or i >= len(forwardingTable):
+        return None
+    return usableNextHop(i)
+
+def usableNextHop(i):
+    nextHop = forwardingTable[i][1]
+    if nextHop is not None and not isUp.get(nextHop, True) and i < len(alternateTable):
+        alternate = alternateTable[i]
+        if alternate is not None and isUp.get(alternate, True):
+            return alternate
+    return nextHop
+
+# equal cost next hops for destKey that are up (only with --ecmp)
+def equalCostHopsTo(destKey):
+    return tuple(nextHop for nextHop in equalCostTable[nodesLocationDict[destKey]] if isUp.get(nextHop, True))
+
+# returns the set of destinations whose next hop changed
 def buildForwardTable():
-    # make new lists
-    nodesReached = dict() # {nodeKey: (distance, [p, a, t, h])}
-    possiblePaths = list() # [(distance, [p, a, t, h]), ...]
-
-    # initialize Djikstra's with neighbors
-    for neighbor in topology[hostKey].keys():
-        # do not add anything with infinite distance
-        if topology[hostKey][neighbor] >= sys.maxsize / 4:
-            continue
-        
-        bisect.insort(possiblePaths, (topology[hostKey][neighbor], [hostKey, neighbor]))
-    nodesReached[hostKey] = (0, None)
-
-    # do Djikstra's
-    while len(nodesReached) < len(topology) and len(possiblePaths) > 0:
-        # get next possible path
-        pPath = possiblePaths.pop(0)
-        destNode = pPath[1][-1]
+    global shortestPathTree
+    global changedLinks
+    global forwardingTable
+    global equalCostTable
+    global alternateTable
+
+    start = monotonic()
+    if shortestPathTree is None:
+        # do Djikstra's from this host
+        shortestPathTree = spf.ShortestPathTree(topology, hostIndex)
+        changed = set(range(len(topology)))
+        spfKind = "full"
+    else:
+        # only repair the part of the tree under the links that changed
+        changed = shortestPathTree.linksChanged(changedLinks)
+        spfKind = "incremental"
+    changedLinks = list()
+
+    if args.ecmp:
+        # the tree only keeps one first hop so go over it again for the rest
+        newEqualCostTable = spf.equalCostHops(topology, hostIndex, shortestPathTree.dist)
+        for i, hops in enumerate(newEqualCostTable):
+            if i >= len(equalCostTable) or hops != equalCostTable[i]:
+                changed.add(i)
+        equalCostTable = newEqualCostTable
+
+    if args.lfa:
+        alternateTable = spf.loopFreeAlternates(topology, hostIndex, shortestPathTree.dist, shortestPathTree.firstHop)
+
+    changed.discard(hostIndex)
 
-        if destNode in nodesReached.keys(): # don't repeat nodes
+    # make new forwarding table to be copied over old forwarding table
+    newForwardingTable = list(forwardingTable[:len(topology)])
+    newForwardingTable += [(None, None)] * (len(topology) - len(newForwardingTable))
+
+    # store indexes are the same as in nodesLocationDict
+    for i in changed:
+        nextHop = shortestPathTree.firstHop[i]
+        if nextHop is None:
+            newForwardingTable[i] = (None, None)
             continue
+        forwardingValue = (topology.ids[i], nextHop)
+        newForwardingTable[i] = forwardingValue
 
-        # add nodes to reached lists
-        nodesReached[destNode] = pPath
+    # tell the subscriber what changed
+    if fibPublisher is not None:
+        for i in changed:
+            fibPublisher.update(topology.ids[i], routeTo(i, newForwardingTable[i][1]))
+        if spfKind == "full":
+            # nodes dropped from topology are not in changed
+            fibPublisher.withdrawMissing(topology.index)
+        fibPublisher.flush()
 
-        # add next nodes to possible paths
-        for key in topology[destNode].keys():
-            # do not add anything with infinite distance
-            if topology[destNode][key] >= sys.maxsize / 4:
-                continue
-            nextDist = pPath[0] + topology[destNode][key]
-            nextPath = copy.deepcopy(pPath[1])
-            nextPath.append(key)
+    # swap the new forwarding table in, entries are tuples so nothing else has to be copied
+    forwardingTable = newForwardingTable
 
-            bisect.insort(possiblePaths, (nextDist, nextPath))
+    # swap the new table in for the workers
+    publishForwardingTable()
+    spfTimes[spfKind].observe(monotonic() - start)
 
-    # make new forwarding table to be copied over old forwarding table
-    newForwardingTable = [(None, None)] * len(largestSeqNo)
-    nodesReached.pop(hostKey) # remove host value needed earlier
+    # print topology and forwarding table every time it changes
+    # since this is called every time it changes it is sufficient to print this here
+    # it is slow on big topologies so only when asked for
+    if args.printTables:
+        printTandFT()
+
+    return {topology.ids[i] for i in changed}
+
+# (nextHop, ...) of the node at index i for the fib delta subscriber
+def routeTo(i, nextHop):
+    if nextHop is None:
+        return ()
+    if args.ecmp and equalCostTable[i]:
+        return equalCostTable[i]
+    return (nextHop,)
+
+# swap the forwarding table in for the workers
+# with an entry for every equal cost next hop and alternates in place of next hops that are down
+# destinations that do not fit are left out whole (never part of an equal cost group) and counted
+def publishForwardingTable():
+    global sharedTableOverflow
+
+    if sharedForwardingTable is None:
+        return
 
-    for destKey in nodesReached.keys():
-        nextHopK = nodesReached[destKey][1][1]
-        nextHop = (str(nextHopK[0]), nextHopK[1])
-        forwardingValue = (destKey, nextHop)
-        newForwardingTable[nodesLocationDict[destKey]] = forwardingValue
+    entries = list()
+    overflow = 0
+    for i, entry in enumerate(forwardingTable):
+        if entry == (None, None):
+            continue
+        hops = ()
+        if args.ecmp:
+            hops = tuple(nextHop for nextHop in equalCostTable[i] if isUp.get(nextHop, True))
+        if not hops:
+            hops = (usableNextHop(i),)
+        if len(entries) + len(hops) > sharedForwardingTable.capacity:
+            overflow += 1
+            continue
+        entries.extend((entry[0], nextHop) for nextHop in hops)
 
-    # copy new forwarding table over old forwarding table
-    global forwardingTable
-    forwardingTable = copy.deepcopy(newForwardingTable)
+    if overflow and overflow != sharedTableOverflow:
+        print(f"Shared forwarding table is full, {overflow} destinations left out so workers have no path to them")
+    sharedTableOverflow = overflow
 
-    # print topology and forwarding table every time it changes
-    # since this is called every time it changes it is sufficient to print this here
-    printTandFT()
+    sharedForwardingTable.publish(entries)
 
 def printTandFT():
     # print topology
     print("Topology:\n")
 
     for node in nodesLocationDict.keys():
+        if node not in topology.index:
+            continue
+
         # make beginning of string and wether to print variable
-        strToPrint = f"{str(node[0])},{node[1]}"
+        strToPrint = nodes.nodeName(node)
         toPrint = False
 
-        for next in topology[node].keys():
-            # do not add infinite values
-            if topology[node][next] >= sys.maxsize / 4:
-                continue
-
+        # only links that are up
+        for next, cost in topology.links(topology.index[node]):
             toPrint = True
-            strToPrint += f" {str(next[0])},{next[1]},{topology[node][next]}"
+            strToPrint += f" {nodes.nodeName(topology.ids[next])},{cost}"
 
         if toPrint:
             print(strToPrint)
@@ -613,20 +969,146 @@ def printTandFT():
     # print Forwarding Table
     print("Forwarding Table:\n")
     
-    for entry in forwardingTable:
+    for i, entry in enumerate(forwardingTable):
         if entry == (None, None):
             continue
-        print(f"{str(entry[0][0])},{entry[0][1]} {entry[1][0]},{entry[1][1]}")
+        if args.ecmp and equalCostTable[i]:
+            # every equal cost next hop
+            print(nodes.nodeName(entry[0]) + "".join(f" {nodes.nodeName(nextHop)}" for nextHop in equalCostTable[i]))
+            continue
+        print(f"{nodes.nodeName(entry[0])} {nodes.nodeName(entry[1])}")
 
     print() # extra line for spacing
 
+# fork the forwarding workers
+# they keep running until this process exits
+def startWorkers():
+    global sharedForwardingTable
+
+    if not workerSocs:
+        return
+
+    # the mapping cannot grow once the workers are forked so leave room for nodes found at runtime
+    # pages that are never written are never used
+    sharedForwardingTable = fib.SharedForwardingTable(max(65536, 4 * len(topology)))
+    publishForwardingTable()
+
+    for workerSoc in workerSocs:
+        if os.fork() == 0:
+            # keep only this worker's socket so a worker that dies takes its socket out of the
+            # reuseport group with it instead of a sibling keeping it open with nobody reading
+            for otherSoc in workerSocs:
+                if otherSoc is not workerSoc:
+                    otherSoc.close()
+            recSoc.close()
+            for soc in (statsSoc, wakeSoc, signalSoc):
+                if soc is not None:
+                    soc.close()
+            if signalSoc is not None:
+                signal.set_wakeup_fd(-1)
+                signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+            dataplane.runWorker(workerSoc, controlSoc, sharedForwardingTable, args.batchSize, hashSeed)
+            sys.stdout.flush()
+            os._exit(0)
+        workerSoc.close()
+
+# send the whole forwarding table to the subscriber on SIGUSR1
+# the handler only sets a flag, the table is sent from the event loop once it wakes up
+def startFibDeltas():
+    global wakeSoc
+    global signalSoc
+
+    if fibPublisher is None:
+        return
+
+    wakeSoc, signalSoc = socket.socketpair()
+    wakeSoc.setblocking(0)
+    signalSoc.setblocking(0)
+    signal.set_wakeup_fd(signalSoc.fileno())
+    selector.register(wakeSoc, selectors.EVENT_READ)
+
+    def requestFullTable(signum, frame):
+        global fullTableRequested
+        fullTableRequested = True
+    signal.signal(signal.SIGUSR1, requestFullTable)
+
+# handle signals that woke the event loop
+def handleSignals():
+    global fullTableRequested
+
+    try:
+        while wakeSoc.recv(64):
+            pass
+    except BlockingIOError:
+        pass
+
+    if fullTableRequested:
+        fullTableRequested = False
+        fibPublisher.full()
+
+# set up the metrics and where they are written
+def startMetrics():
+    registry = metricsRegistry
+    registry.counter("emulator_packets_received_total", "Packets recieved by packet type.",
+                     lambda: metrics.collectTypes(packetsRecieved))
+    registry.counter("emulator_packets_sent_total", "Packets sent by packet type.",
+                     lambda: metrics.collectTypes(packetsSent))
+    registry.counter("emulator_packets_dropped_total", "Packets dropped by packet type and reason.",
+                     lambda: [({"type": metrics.typeName(pType), "reason": reason}, count) for (pType, reason), count in packetsDropped.items()])
+    registry.counter("emulator_ingress_dropped_total", "Packets dropped because the queue for their class was full.",
+                     lambda: [({"class": name}, drops) for name, drops in zip(ingress.CLASS_NAMES, ingressScheduler.drops)])
+    registry.gauge("emulator_ingress_queue_depth", "Packets waiting to be handled by class.",
+                   lambda: [({"class": name}, len(queue)) for name, queue in zip(ingress.CLASS_NAMES, ingressScheduler.queues)])
+    registry.counter("emulator_link_states_accepted_total", "Link state packets newer than the stored one.",
+                     lambda: [({}, linkStatesAccepted)])
+    registry.counter("emulator_link_states_duplicate_total", "Link state packets dropped as duplicates or old copies.",
+                     lambda: [({}, sum(suppressedLinkStates.values()))])
+    registry.gauge("emulator_link_state_database_entries", "Link states kept from other nodes.",
+                   lambda: [({}, len(linkStates))])
+    registry.histogram("emulator_spf_seconds", "Seconds to build the forwarding table by full or incremental shortest path computation.",
+                       lambda: [({"kind": kind}, histogram) for kind, histogram in spfTimes.items()])
+    registry.gauge("emulator_topology_nodes", "Nodes in the topology.",
+                   lambda: [({}, len(topology))])
+    registry.gauge("emulator_forwarding_entries", "Destinations with a next hop.",
+                   lambda: [({}, sum(1 for entry in forwardingTable if entry[1] is not None))])
+    if workerSocs:
+        registry.gauge("emulator_shared_forwarding_overflow", "Destinations left out of the table the workers forward with because it is full.",
+                       lambda: [({}, sharedTableOverflow)])
+    registry.gauge("emulator_neighbor_up", "1 if the neighbor is up.",
+                   lambda: [({"neighbor": nodes.nodeName(key)}, int(up)) for key, up in isUp.items()])
+    registry.counter("emulator_neighbor_transitions_total", "Times a neighbor went up or down.",
+                     lambda: [({"neighbor": nodes.nodeName(key), "direction": direction}, count) for (key, direction), count in neighborChanges.items()])
+    if args.bfdInterval > 0:
+        registry.gauge("emulator_bfd_session_state", "State of the bfd session with the neighbor (1 down, 2 init, 3 up).",
+                       lambda: [({"neighbor": nodes.nodeName(key)}, session.state) for key, session in bfdSessions.items()])
+
+    if statsSoc is not None:
+        selector.register(statsSoc, selectors.EVENT_READ)
+    if args.metricsFile is not None:
+        timerHeap.schedule(monotonic(), metricsTimer)
+
+# write the metrics file every metricsInterval
+def metricsTimer():
+    try:
+        metricsRegistry.writeFile(args.metricsFile)
+    except OSError:
+        print("An error occured writing the metrics file")
+        print(traceback.format_exc())
+    timerHeap.schedule(monotonic() + metricsInterval, metricsTimer)
+
 def cleanup():
     recSoc.close()
+    if statsSoc is not None:
+        statsSoc.close()
+        os.unlink(args.statsSocket)
     sys.exit()
 
 def main():
     readtopology()
+    startMetrics()
+    startFibDeltas()
     buildForwardTable()
+    startWorkers()
     createroutes()
     cleanup()
 
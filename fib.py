@@ -0,0 +1,74 @@
+import mmap
+import struct
+
+# forwarding table published by the control process to the forwarding workers
+# it lives in an anonymous shared mapping so it has to be made before the workers are forked
+# there are two copies of the table, version & 1 is the one in use
+# the writer fills the other copy and then bumps the version to swap them
+# readers copy the table out and check the version did not move while they were copying
+
+VERSION = struct.Struct('=Q')
+COUNT = struct.Struct('=Q')
+ENTRY = struct.Struct('=QQ') # dest node id, next hop node id (a dest has one entry for every equal cost next hop)
+
+class SharedForwardingTable:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.copySize = COUNT.size + ENTRY.size * capacity
+        self.memory = mmap.mmap(-1, VERSION.size + 2 * self.copySize)
+
+        self.version = None # version of table as last read by this process
+        self.table = dict() # {dest: (nextHop, ...)} copied out of the shared table
+
+    def _copyOffset(self, version):
+        return VERSION.size + (version & 1) * self.copySize
+
+    # write [(dest, nextHop)] node ids into the unused copy and swap it in
+    # entries for the same dest have to be next to each other
+    # only one process may publish
+    def publish(self, entries):
+        if len(entries) > self.capacity:
+            raise ValueError(f"forwarding table has {len(entries)} entries but room for {self.capacity}")
+
+        memory = self.memory
+        version = VERSION.unpack_from(memory, 0)[0] + 1
+        offset = self._copyOffset(version)
+
+        COUNT.pack_into(memory, offset, len(entries))
+        offset += COUNT.size
+        for dest, nextHop in entries:
+            ENTRY.pack_into(memory, offset, dest, nextHop)
+            offset += ENTRY.size
+
+        VERSION.pack_into(memory, 0, version)
+
+    # copy the shared table into self.table if a new version was published
+    # returns True if the table changed
+    def refresh(self):
+        memory = self.memory
+
+        while True:
+            version = VERSION.unpack_from(memory, 0)[0]
+            if version == self.version:
+                return False
+
+            offset = self._copyOffset(version)
+            count = COUNT.unpack_from(memory, offset)[0]
+            if count > self.capacity:
+                continue # read while the copy was being written
+
+            start = offset + COUNT.size
+            table = dict()
+            for dest, nextHop in ENTRY.iter_unpack(memory[start:start + count * ENTRY.size]):
+                hops = table.get(dest)
+                table[dest] = (nextHop,) if hops is None else hops + (nextHop,)
+
+            # the writer only touches this copy again two versions later
+            if VERSION.unpack_from(memory, 0)[0] == version:
+                self.version = version
+                self.table = table
+                return True
+
+    # (nextHop, ...) node ids for dest or None if there is no path (call refresh first)
+    def nextHops(self, dest):
+        return self.table.get(dest)
@@ -0,0 +1,121 @@
+import socket
+import sys
+
+import nodes
+
+# forwarding table changes sent to a subscriber instead of printing the whole table
+# every build of the forwarding table that changed something is a new version and only the
+# destinations that were added, changed or withdrawn in it are written out
+#
+# line format:
+# <version> add <dest> <nextHop> [<nextHop> ...]
+# <version> change <dest> <nextHop> [<nextHop> ...]
+# <version> withdraw <dest>
+# and for the whole table on demand, the subscriber drops what it has on reset:
+# <version> reset
+# <version> full <dest> <nextHop> [<nextHop> ...]
+
+ADD = "add"
+CHANGE = "change"
+WITHDRAW = "withdraw"
+
+# most bytes sent in one datagram to a socket subscriber
+DATAGRAM_SIZE = 60000
+
+# subscriber for target which is "-" for stdout, unix:<path> for a unix datagram socket
+# or the name of a file to append to
+def openSubscriber(target):
+    if target == "-":
+        return StreamSubscriber(sys.stdout)
+    if target.startswith("unix:"):
+        return SocketSubscriber(target[len("unix:"):])
+    return StreamSubscriber(open(target, 'a'))
+
+# writes lines to a file object and flushes them
+class StreamSubscriber:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, lines):
+        self.stream.write("".join(line + "\n" for line in lines))
+        self.stream.flush()
+
+# sends lines to a unix datagram socket as a few datagrams as possible
+# lines are dropped while nothing is listening like any other datagram
+class SocketSubscriber:
+    def __init__(self, path):
+        self.path = path
+        self.soc = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.soc.setblocking(0)
+
+    def write(self, lines):
+        chunk = list()
+        size = 0
+        for line in lines:
+            if chunk and size + len(line) + 1 > DATAGRAM_SIZE:
+                self._send(chunk)
+                chunk = list()
+                size = 0
+            chunk.append(line)
+            size += len(line) + 1
+        if chunk:
+            self._send(chunk)
+
+    def _send(self, chunk):
+        try:
+            self.soc.sendto("".join(line + "\n" for line in chunk).encode(), self.path)
+        except OSError:
+            pass # subscriber is not there or is behind
+
+# the forwarding table as the subscriber last saw it
+# routes are (nextHop, ...) node ids, an empty tuple is no route
+class DeltaPublisher:
+    def __init__(self, subscriber):
+        self.subscriber = subscriber
+        self.version = 0
+        self.routes = dict() # {dest: (nextHop, ...)} as published
+        self.pending = list() # [(op, dest, routes)] not written out yet
+
+    # set the route to dest, a delta is only made if it is different from the published one
+    def update(self, dest, nextHops):
+        old = self.routes.get(dest)
+        if not nextHops:
+            if old is not None:
+                del self.routes[dest]
+                self.pending.append((WITHDRAW, dest, ()))
+            return
+
+        nextHops = tuple(nextHops)
+        if old == nextHops:
+            return
+        self.routes[dest] = nextHops
+        self.pending.append((ADD if old is None else CHANGE, dest, nextHops))
+
+    # withdraw every published dest that is not in keep
+    def withdrawMissing(self, keep):
+        for dest in [dest for dest in self.routes if dest not in keep]:
+            self.update(dest, ())
+
+    # write the deltas since the last flush out as a new version
+    # returns the number of deltas written
+    def flush(self):
+        if not self.pending:
+            return 0
+
+        self.version += 1
+        version = self.version
+        lines = [_line(version, op, dest, nextHops) for op, dest, nextHops in self.pending]
+        count = len(self.pending)
+        self.pending = list()
+        self.subscriber.write(lines)
+        return count
+
+    # write the whole table at the current version
+    def full(self):
+        self.flush()
+        lines = [f"{self.version} reset"]
+        lines += [_line(self.version, "full", dest, nextHops) for dest, nextHops in self.routes.items()]
+        self.subscriber.write(lines)
+
+def _line(version, op, dest, nextHops):
+    return f"{version} {op} {nodes.nodeName(dest)}" + "".join(f" {nodes.nodeName(nextHop)}" for nextHop in nextHops)
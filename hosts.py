@@ -0,0 +1,59 @@
+import selectors
+import socket
+import sys
+import time
+
+import batchio
+import dataplane
+import snapshot
+
+# everything the emulator takes from the machine it runs on: command line, address, clock,
+# topology file and sockets
+# emulator.py always goes through a host, the real one below or a simulated node (simulator.py)
+# that has the same methods and runs on a virtual clock and an event heap instead of sockets
+
+class Host:
+    def __init__(self):
+        self.argv = sys.argv[1:]
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def wallTime(self):
+        return time.time()
+
+    # ip address string the emulator is reached on
+    def ipAddr(self):
+        return socket.gethostbyname(socket.gethostname())
+
+    # {node: {next: cost}} of the topology file or snapshot
+    def readTopology(self, fileName, sourceName):
+        return dict(snapshot.readTopologyLinks(fileName, sourceName))
+
+    # (recSoc, controlSoc, [workerSoc]) bound to addr
+    # with workers they all share the port and pass everything but network traffic to recSoc
+    # through controlSoc, without them recSoc is bound to addr and controlSoc is None
+    def bind(self, addr, workers):
+        workerSocs = list()
+        controlSoc = None
+        if workers > 0:
+            for i in range(workers):
+                workerSocs.append(dataplane.workerSocket(addr))
+            recSoc, controlSoc = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        else:
+            recSoc = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            recSoc.bind(addr)
+        recSoc.setblocking(0)
+        return (recSoc, controlSoc, workerSocs)
+
+    # (sendSoc, sendBatch), sendSoc.sendto sends one packet and sendBatch.sendToAll sends one
+    # packet to many addresses
+    def senders(self):
+        sendSoc = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        return (sendSoc, batchio.SendBatch(sendSoc))
+
+    def receiveBatch(self, count):
+        return batchio.ReceiveBatch(count)
+
+    def selector(self):
+        return selectors.DefaultSelector()
@@ -0,0 +1,79 @@
+from collections import deque
+
+# ingress scheduling for the emulator
+# recieved packets wait in a bounded queue for their class so control packets are handled
+# before network traffic that came in ahead of them
+
+# packet classes in order of priority
+HELLO = 0
+LINK_STATE = 1
+ROUTE_TRACE = 2
+DATA_1 = 3 # network traffic with priority 1
+DATA_2 = 4
+DATA_3 = 5
+
+CLASS_NAMES = ("hello", "link state", "route trace", "data 1", "data 2", "data 3")
+
+# packets taken from each class per round when scheduling is weighted
+DEFAULT_WEIGHTS = (8, 8, 4, 4, 2, 1)
+
+# class of a packet from its type byte or None if it is not a known type
+def packetClass(pType):
+    if pType == 72 or pType == 66: # 'H', 'B'
+        return HELLO
+    if pType == 76: # 'L'
+        return LINK_STATE
+    if pType == 79 or pType == 84: # 'O', 'T'
+        return ROUTE_TRACE
+    if pType < 4: # network traffic, priority 1 to 3
+        return DATA_1 + min(max(pType, 1), 3) - 1
+    return None
+
+class IngressScheduler:
+    # queueSize is the most packets kept for each class
+    # weights is packets per round for each class or None for strict priority
+    def __init__(self, queueSize, weights=None):
+        self.queueSize = queueSize
+        self.weights = weights
+        self.queues = [deque() for name in CLASS_NAMES] # [deque of (packet, addr)]
+        self.drops = [0] * len(CLASS_NAMES) # packets dropped because their queue was full
+        self.count = 0 # packets waiting in all queues
+
+    def __len__(self):
+        return self.count
+
+    # queue a packet, it is copied so the recieve buffer can be reused
+    # returns False if it was dropped
+    def push(self, data, addr):
+        pClass = packetClass(data[0])
+        if pClass is None:
+            return False # not a packet the emulator knows about
+
+        queue = self.queues[pClass]
+        if len(queue) >= self.queueSize:
+            self.drops[pClass] += 1
+            return False
+
+        queue.append((bytearray(data), addr))
+        self.count += 1
+        return True
+
+    # take up to budget packets off the queues in the order they should be handled
+    # returns [(packet, addr)]
+    def pop(self, budget):
+        taken = list()
+
+        if self.weights is None:
+            # strict priority, lower classes only go once everything above them is empty
+            for queue in self.queues:
+                while queue and len(taken) < budget:
+                    taken.append(queue.popleft())
+        else:
+            # weighted rounds so low priority traffic still gets some of the budget
+            while self.count > len(taken) and len(taken) < budget:
+                for queue, weight in zip(self.queues, self.weights):
+                    for i in range(min(weight, len(queue), budget - len(taken))):
+                        taken.append(queue.popleft())
+
+        self.count -= len(taken)
+        return taken
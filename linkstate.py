@@ -0,0 +1,94 @@
+import sys
+
+import packets
+
+# link state database for the emulator
+# keeps the latest link state advertisement from every origin keyed by node id
+# an advertisement that is not refreshed within maxAge is flushed
+
+# one advertisement, data is the link state data as it came in (see packets.py)
+# it is the only copy of the links so they take 10 bytes a link and are decoded when they are read
+class LinkStateAdvertisement:
+    __slots__ = ("seqNo", "received", "data")
+
+    def __init__(self, seqNo, received, data):
+        self.seqNo = seqNo
+        self.received = received # time.monotonic() seconds
+        self.data = data
+
+    # seconds since it was recieved
+    def age(self, now):
+        return now - self.received
+
+class LinkStateDatabase:
+    def __init__(self, maxAge):
+        self.maxAge = maxAge
+        self.entries = dict() # {origin: LinkStateAdvertisement}
+
+    def __len__(self):
+        return len(self.entries)
+
+    # seqNo of the advertisement from origin or None if there is none
+    def seqNo(self, origin):
+        entry = self.entries.get(origin)
+        if entry is None:
+            return None
+        return entry.seqNo
+
+    # {next: cost} advertised by origin with sys.maxsize for links that are down
+    # or None if there is no advertisement from origin
+    def adjacency(self, origin):
+        entry = self.entries.get(origin)
+        if entry is None:
+            return None
+        return packets.decodeLinkState(entry.data)
+
+    # (origin, {next: cost}) of every advertisement
+    def adjacencies(self):
+        for origin, entry in self.entries.items():
+            yield (origin, packets.decodeLinkState(entry.data))
+
+    # cost origin advertises for its link to next, sys.maxsize if it is down or not advertised
+    # or None if there is no advertisement from origin
+    # reads the link straight out of the data without decoding the rest
+    def cost(self, origin, next):
+        entry = self.entries.get(origin)
+        if entry is None:
+            return None
+        ip, port = next >> 16, next & 0xFFFF
+        for entryIp, entryPort, cost in packets.LINK_ENTRY.iter_unpack(entry.data):
+            if entryIp == ip and entryPort == port:
+                return sys.maxsize if cost == packets.INFINITE_LINK else cost
+        return sys.maxsize
+
+    # store an advertisement from origin, seqNo must be newer than the one stored
+    # returns True if its links are different from the last advertisement
+    # raises ValueError if data is not whole links, the stored advertisement is left as it was
+    def install(self, origin, seqNo, data, now):
+        data = bytes(data)
+        if len(data) % packets.LINK_ENTRY.size:
+            raise ValueError(f"link state data of {len(data)} bytes is not whole links")
+
+        entry = self.entries.get(origin)
+        if entry is None:
+            self.entries[origin] = LinkStateAdvertisement(seqNo, now, data)
+            return True
+
+        entry.seqNo = seqNo
+        entry.received = now
+        if entry.data == data:
+            return False # refresh only
+        entry.data = data
+        return True
+
+    # remove the advertisement from origin
+    def remove(self, origin):
+        self.entries.pop(origin, None)
+
+    # flush every advertisement older than maxAge
+    # returns [origin] of the ones flushed
+    def expire(self, now):
+        expired = [origin for origin, entry in self.entries.items() if entry.age(now) > self.maxAge]
+        for origin in expired:
+            self.remove(origin)
+        return expired
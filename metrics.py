@@ -0,0 +1,119 @@
+import bisect
+import os
+import socket
+
+# metrics for the emulator in the prometheus text format
+# the emulator only bumps plain lists and dicts while it handles packets, they are turned into
+# metrics by collect functions when someone asks for them (a file written every few seconds or
+# a request on the stats socket) so counting costs about as much as a list index
+
+# name of every packet type byte for labels
+TYPE_NAMES = {72: "hello", 66: "bfd", 76: "link_state", 79: "route_trace_return", 84: "route_trace"}
+
+# name of a packet type byte, network traffic is its priority
+def typeName(pType):
+    if pType < 4:
+        return f"data_{pType}"
+    return TYPE_NAMES.get(pType, "unknown")
+
+# a list indexed by packet type byte to count packets in
+def typeCounts():
+    return [0] * 256
+
+# [(labels, value)] of every packet type with a count in counts
+def collectTypes(counts):
+    return [({"type": typeName(pType)}, count) for pType, count in enumerate(counts) if count]
+
+# bucket bounds in seconds from 100 microseconds to about 3 seconds
+DEFAULT_BOUNDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+class Histogram:
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # last one is everything above the biggest bound
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+# metrics to write out, kept in the order they were added
+# collect is a function returning [(labels dict, value)] where value is a number or a Histogram
+class Registry:
+    def __init__(self):
+        self.metrics = list() # [(name, kind, help, collect)]
+
+    def counter(self, name, help, collect):
+        self.metrics.append((name, "counter", help, collect))
+
+    def gauge(self, name, help, collect):
+        self.metrics.append((name, "gauge", help, collect))
+
+    def histogram(self, name, help, collect):
+        self.metrics.append((name, "histogram", help, collect))
+
+    # every metric in the prometheus text format
+    def render(self):
+        lines = list()
+        for name, kind, help, collect in self.metrics:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in collect():
+                if kind == "histogram":
+                    _histogramLines(lines, name, labels, value)
+                else:
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    # write the metrics to fileName through a file next to it
+    # so something reading it never sees half of them
+    def writeFile(self, fileName):
+        with open(fileName + ".tmp", 'w') as metricsFile:
+            metricsFile.write(self.render())
+        os.replace(fileName + ".tmp", fileName)
+
+    # answer every request waiting on a datagram stats socket with the metrics
+    # anything sent to the socket is a request
+    def serve(self, statsSoc):
+        while True:
+            try:
+                request, addr = statsSoc.recvfrom(64)
+            except BlockingIOError:
+                return
+            if not addr:
+                continue # unbound client, nowhere to answer
+            try:
+                statsSoc.sendto(self.render().encode(), addr)
+            except OSError:
+                pass # client went away or the answer is too big for it
+
+# unix datagram socket bound to path for stats requests
+# a stale socket file from an emulator that did not clean up is replaced
+def statsSocket(path):
+    if os.path.exists(path):
+        os.unlink(path)
+    statsSoc = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    statsSoc.bind(path)
+    statsSoc.setblocking(0)
+    return statsSoc
+
+def _histogramLines(lines, name, labels, histogram):
+    cumulative = 0
+    for bound, count in zip(histogram.bounds, histogram.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels(dict(labels, le=repr(bound)))} {cumulative}")
+    lines.append(f"{name}_bucket{_labels(dict(labels, le='+Inf'))} {histogram.count}")
+    lines.append(f"{name}_sum{_labels(labels)} {_number(histogram.sum)}")
+    lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(int(value))
@@ -0,0 +1,44 @@
+import socket
+
+# nodes are identified by a single int of ip << 16 | port
+# so tables can be keyed without building ipaddress objects for every packet
+
+# cache of the (ip string, port) address to send to for every node id seen
+addresses = dict()
+
+# node id of an ip (as an int) and port
+def nodeId(ip, port):
+    return (ip << 16) | port
+
+# split a node id back into (ip as an int, port)
+def splitNode(node):
+    return (node >> 16, node & 0xFFFF)
+
+# node id of an ip string and port, caching its address
+def internNode(ipText, port):
+    ip = int.from_bytes(socket.inet_aton(ipText), 'big')
+    node = nodeId(ip, port)
+    if node not in addresses:
+        addresses[node] = (socket.inet_ntoa(ip.to_bytes(4, 'big')), port)
+    return node
+
+# node id of an "ip,port" string like the ones in the topology file
+def parseNode(text):
+    vals = text.split(',')
+    return internNode(vals[0], int(vals[1]))
+
+# (ip string, port) address to send to for a node id
+def sockaddr(node):
+    addr = addresses.get(node)
+    if addr is None:
+        addr = (socket.inet_ntoa((node >> 16).to_bytes(4, 'big')), node & 0xFFFF)
+        addresses[node] = addr
+    return addr
+
+# "ip,port" string of a node id for printing
+# it does not add node to addresses so printing ids off arbitrary packets does not grow it
+def nodeName(node):
+    addr = addresses.get(node)
+    if addr is None:
+        return f"{socket.inet_ntoa((node >> 16).to_bytes(4, 'big'))},{node & 0xFFFF}"
+    return f"{addr[0]},{addr[1]}"
@@ -1,11 +1,19 @@
 import argparse
 import sys
 import socket
-from datetime import datetime, timedelta
+from datetime import datetime
+from time import monotonic
+import heapq
+import itertools
 import traceback
 import logging
 import random
-import ipaddress
+import selectors
+
+import nodes
+import packets
+import resolver
+import snapshot
 
 parser = argparse.ArgumentParser(description="Network Emulator")
 
@@ -13,6 +21,7 @@ parser.add_argument("-p", "--port", type=int, required=True, dest="port")
 parser.add_argument("-f", "--filename", type=str, required=True, dest="fileName")
 parser.add_argument("-q", "--queue_size", type=int, required=True, dest="queueSize")
 parser.add_argument("-l", "--log", type=str, required=True, dest="logName")
+parser.add_argument("-H", "--hosts", type=str, default=None, dest="hostsName") # hosts style file to resolve names from
 
 args = parser.parse_args()
 
@@ -32,9 +41,18 @@ if 2049 > args.port or args.port > 65536:
     logging.critical("Requester port out of range.")
     sys.exit()
 
+# names from the hosts file are never looked up
+if args.hostsName is not None:
+    try:
+        resolver.loadHosts(args.hostsName)
+    except:
+        logging.critical("An error occured reading the hosts file")
+        logging.critical(traceback.format_exc())
+        sys.exit()
+
 # open port (to listen on only?)
 hostname = socket.gethostname()
-ipAddr = socket.gethostbyname(hostname)
+ipAddr = resolver.resolve(hostname)
 
 reqAddr = (ipAddr, args.port)
 
@@ -51,12 +69,19 @@ except:
 # socket to send from (not the same one)
 sendSoc = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
-# these lists will have (packet, (destIP, destSoc), timeToSend, nextHop)
+# a min heap of (timeToSend, sequence number, packet, nextHop, lossProb) for every priority
+# delay is per destination so packets can be due in a different order than they were recieved
+# timeToSend is time.monotonic() seconds
 queue = [list(), list(), list()]
+queueCounter = itertools.count() # keeps packets due at the same time in the order they were recieved
 
 # variable for determining if emulator should keep listening for packets
 isListening = True
 
+# wait on the socket until a packet comes in or the next queued packet can be sent
+selector = selectors.DefaultSelector()
+recieveBatch = 64 # most packets recieved per wakeup
+
 # set up random
 random.seed(9)
 
@@ -64,24 +89,38 @@ random.seed(9)
 def readTracker():
     # create dictionary with file names
     global table
+
+    # compiled forwarding files already have every host looked up (see snapshot.py)
+    if snapshot.isSnapshot(args.fileName):
+        forwardingSnapshot = snapshot.Snapshot(args.fileName)
+        table = forwardingSnapshot.forwardingTable(nodes.internNode(ipAddr, args.port))
+        forwardingSnapshot.close()
+        return
+
     table = dict()
 
-    # first pass to get size for arrays of tuples of data
+    # first pass to find the lines for this emulator
+    entries = list()
     with open(args.fileName, 'r') as ftable:
-        lines = ftable.readlines()
-        for line in lines:
+        for line in ftable:
             vals = line.split()
 
             # check if it is the right emulator
-            if vals[0] != hostname or int(vals[1]) != args.port:
+            if not vals or vals[0] != hostname or int(vals[1]) != args.port:
                 continue
+            entries.append(vals)
 
-            # check if the value exists in the dictionary
-            destKey = (ipaddress.ip_address(socket.gethostbyname(vals[2])), int(vals[3]))
-            if table.get(destKey) is None:
-                table[destKey] = list()
-            # add string values to array
-            table[destKey].append(((ipaddress.ip_address(socket.gethostbyname(vals[4])), int(vals[5])), int(vals[6]), int(vals[7]) / 100))
+    # look every name up once, all at the same time
+    addrs = resolver.resolveAll([vals[i] for vals in entries for i in (2, 4)])
+
+    for vals in entries:
+        # check if the value exists in the dictionary
+        # destinations and next hops are node ids (see nodes.py)
+        destKey = nodes.internNode(addrs[vals[2]], int(vals[3]))
+        if table.get(destKey) is None:
+            table[destKey] = list()
+        # add (nextHop, delay in seconds, loss probability)
+        table[destKey].append((nodes.internNode(addrs[vals[4]], int(vals[5])), int(vals[6]) / 1000, int(vals[7]) / 100))
 
 # write logs
 def logPacket(pack, recAddr, destAddr, reason):
@@ -102,10 +141,7 @@ def logPacket(pack, recAddr, destAddr, reason):
 # return -1 if there is an error
 def queuePacket(pack, addr, time):
     # check if it is in the forwarding table
-    destIP = socket.ntohl(int.from_bytes(pack[7:11], 'big'))
-    destPort = socket.ntohs(int.from_bytes(pack[11:13], 'big'))
-    destKey = (ipaddress.ip_address(destIP), destPort)
-
+    destKey = nodes.nodeId(*packets.ADDRESS.unpack_from(pack, packets.DEST_OFFSET))
 
     global table
     tableEntry = table.get(destKey)
@@ -127,14 +163,14 @@ def queuePacket(pack, addr, time):
     # check if you can add it
     if len(queue[priority]) < args.queueSize or pack[17] == 'R' or pack[17] == 'E':
         # calculate time to send
-        tts = time + timedelta(milliseconds=tableEnt[1])
+        tts = time + tableEnt[1]
 
-        # add to queue and return (packet, timeToSend, nextHop, lossProb)
-        queue[priority].append((pack, tableEnt[0], tts, tableEnt[2]))
+        # add to queue
+        heapq.heappush(queue[priority], (tts, next(queueCounter), pack, tableEnt[0], tableEnt[2]))
         return 1
     else:
         # drop packet (don't add it to queue) and log it
-        logPacket(pack, addr, f"{tableEnt[0]}", "the queue is full")
+        logPacket(pack, addr, nodes.nodeName(tableEnt[0]), "the queue is full")
         return 0
     
     
@@ -143,56 +179,73 @@ def queuePacket(pack, addr, time):
 # return 1 if a packet is sent
 # return 0 if no packet is in queue or if a packet is being waited on
 # return -1 if there is an error
-def sendPacket():
+def sendPacket(now):
 
+    # the highest priority with a packet that is due
     for q in queue:
-        # check if there are packets in this queue
-        if len(q) <= 0:
-            continue
-
-        toSend = q[0]
-
-        # check if packet can be sent
-        if toSend[2] < datetime.now():
-            # try to send packet
-            try:
-                if random.random() >= toSend[3]:
-                    recSoc.sendto(toSend[0], (str(toSend[1][0]), toSend[1][1]))
-                else:
-                    logPacket(toSend[0], "N/A", toSend[1], "of chance")
-                # take packet off queue
-                q.pop(0)
-                return 1
-            except:
-                logging.error(f"Something went wrong when sending packet to {toSend[1][0]}:{toSend[1][1]}.")
-                logging.error(traceback.format_exc())
-                return -1
+        if q and q[0][0] <= now:
+            break
+    else:
+        # no packets in queue or waiting on all of them
+        return 0
+
+    tts, seq, pack, nextHop, lossProb = q[0]
+
+    # try to send packet
+    try:
+        if random.random() >= lossProb:
+            recSoc.sendto(pack, nodes.sockaddr(nextHop))
         else:
-            # waiting on packet
-            return 0
-    
-    # no packets in queue
-    return 0
-    
+            logPacket(pack, "N/A", nodes.nodeName(nextHop), "of chance")
+        # take packet off queue
+        heapq.heappop(q)
+        return 1
+    except:
+        logging.error(f"Something went wrong when sending packet to {nodes.nodeName(nextHop)}.")
+        logging.error(traceback.format_exc())
+        return -1
+
+# send every packet whose time has come, higher priorities first
+def sendPackets():
+    now = monotonic()
+    while sendPacket(now) == 1:
+        pass
+
+# seconds until the next packet in any queue can be sent
+# or None if there are no packets in queue
+def nextSendTimeout():
+    deadlines = [q[0][0] for q in queue if q]
+    if not deadlines:
+        return None
+    return max(0, min(deadlines) - monotonic())
 
 # wait for packets
 # step 1 and controls other steps
 def getPackets():
+    selector.register(recSoc, selectors.EVENT_READ)
+
     while isListening:
         try:
-            # try to recieve packet and handle it
-            data, addr = recSoc.recvfrom(4096)
-            queuePacket(data, addr, datetime.now())
+            # sleep until a packet comes in or one in queue can be sent
+            events = selector.select(nextSendTimeout())
+
+            if events:
+                # recieve and queue the packets waiting on the socket
+                # (at most recieveBatch so sending is not held up by a flood)
+                time = monotonic()
+                for i in range(recieveBatch):
+                    data, addr = recSoc.recvfrom(4096)
+                    queuePacket(data, addr, time)
         except BlockingIOError:
-            pass # skip down to sendPacket()
+            pass # socket is empty, skip down to sendPackets()
         except KeyboardInterrupt:
             sys.exit()
         except:
             logging.error("Something went wrong when listening for packet.")
             logging.error(traceback.format_exc())
 
-        # send packet from queue
-        sendPacket()
+        # send packets from queue
+        sendPackets()
 
 
 def cleanup():
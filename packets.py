@@ -0,0 +1,107 @@
+import struct
+import sys
+import zlib
+
+# packet encodings shared by the emulator and routetrace
+
+# header fields are in host byte order which is what socket.htonl(x).to_bytes(4, 'big') writes
+
+# hello packet format: type 1B, srcIP 4B, srcPort 2B
+HELLO = struct.Struct('=BIH')
+
+# link state packet format: type 1B, srcIP 4B, srcPort 2B, lastSenderIP 4B, lastSenderPort 2B, seqNo 4B, TTL 4B, len 4B, data
+LINK_STATE = struct.Struct('=BIHIHIII')
+
+# route trace packet format: type 1B, srcIP 4B, srcPort 2B, destIP 4B, destPort 2B, senderIP 4B, senderPort 2B, TTL 4B
+# optionally followed by probeId 4B which is copied into the 'O' packet sent back for it
+ROUTE_TRACE = struct.Struct('=BIHIHIHI')
+
+# bfd packet format: type 1B, srcIP 4B, srcPort 2B, state 1B, detectMult 1B, desiredMinTx 4B, requiredMinRx 4B
+# intervals are in microseconds
+BFD = struct.Struct('=BIHBBII')
+
+# origin (srcIP, srcPort) and seqNo of a link state packet read without the rest of the header
+LINK_STATE_ORIGIN = struct.Struct('=IH6xI')
+
+# single fields that are read or rewritten in place
+ADDRESS = struct.Struct('=IH') # ip 4B, port 2B
+TTL = struct.Struct('=I')
+PROBE = struct.Struct('=I')
+
+SRC_OFFSET = 1 # srcIP and srcPort of every packet type
+DEST_OFFSET = 7 # destIP and destPort of route trace and network traffic
+LINK_STATE_SENDER_OFFSET = 7
+LINK_STATE_TTL_OFFSET = 17
+ROUTE_TRACE_TTL_OFFSET = 19
+ROUTE_TRACE_PROBE_OFFSET = 23
+
+# seed for pickNextHop from the node id of the router picking
+def hashSeed(node):
+    return zlib.crc32(node.to_bytes(8, 'big'))
+
+# pick one of nextHops for a packet by hashing its srcIP, srcPort, destIP and destPort
+# so every packet of a flow takes the same path
+# seed is different for every router (hashSeed) so routers one after another split flows differently,
+# crc32 is linear so a seed given to it would only flip the same bits for every flow and the split
+# would be the same everywhere, the seed is mixed in with murmur3's finalizer instead
+def pickNextHop(packet, nextHops, seed=0):
+    if len(nextHops) == 1:
+        return nextHops[0]
+    h = zlib.crc32(packet[SRC_OFFSET:DEST_OFFSET + ADDRESS.size]) ^ seed
+    h ^= h >> 16
+    h = (h * 0x85EBCA6B) & 0xFFFFFFFF
+    h ^= h >> 13
+    h = (h * 0xC2B2AE35) & 0xFFFFFFFF
+    h ^= h >> 16
+    return nextHops[h % len(nextHops)]
+
+# rewrite lastSender and TTL of a link state packet in place
+def rewriteLinkState(packet, senderIP, senderPort, tTL):
+    ADDRESS.pack_into(packet, LINK_STATE_SENDER_OFFSET, senderIP, senderPort)
+    TTL.pack_into(packet, LINK_STATE_TTL_OFFSET, tTL)
+
+# rewrite TTL of a route trace packet in place
+def rewriteRouteTrace(packet, tTL):
+    TTL.pack_into(packet, ROUTE_TRACE_TTL_OFFSET, tTL)
+
+# set the probeId of a route trace packet that has room for one
+def rewriteRouteTraceProbe(packet, probeId):
+    PROBE.pack_into(packet, ROUTE_TRACE_PROBE_OFFSET, probeId)
+
+# probeId of a route trace packet or None if it was sent without one
+def routeTraceProbe(packet):
+    if len(packet) < ROUTE_TRACE_PROBE_OFFSET + PROBE.size:
+        return None
+    return PROBE.unpack_from(packet, ROUTE_TRACE_PROBE_OFFSET)[0]
+
+# link state data format: one entry per link of ip 4B, port 2B, cost 4B in network order
+LINK_ENTRY = struct.Struct('!IHI')
+
+# cost sent for a link that is down
+INFINITE_LINK = 0xFFFFFFFF
+
+# encode [(node, cost)] links into link state data (node ids as in nodes.py)
+# down links (cost of sys.maxsize) are sent as INFINITE_LINK
+def encodeLinkState(links):
+    data = bytearray(LINK_ENTRY.size * len(links))
+    offset = 0
+
+    for node, cost in links:
+        if cost >= INFINITE_LINK:
+            cost = INFINITE_LINK
+        LINK_ENTRY.pack_into(data, offset, node >> 16, node & 0xFFFF, cost)
+        offset += LINK_ENTRY.size
+
+    return bytes(data)
+
+# decode link state data into {node: cost} (node ids as in nodes.py)
+# down links come back with a cost of sys.maxsize
+def decodeLinkState(data):
+    links = dict()
+
+    for ip, port, cost in LINK_ENTRY.iter_unpack(data):
+        if cost == INFINITE_LINK:
+            cost = sys.maxsize
+        links[(ip << 16) | port] = cost
+
+    return links
@@ -0,0 +1,195 @@
+import argparse
+import sys
+
+import nodes
+import snapshot
+import spf
+import topologystore
+
+# optional, the dense backend is only there when numpy is installed
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# path computations over a whole topology for tooling that wants the routes of every node
+# not just the host's like the emulator
+# graphs are topologystore.TopologyStore (from snapshot.readTopologyLinks) and nodes are their indexes
+#
+# backends for all pairs:
+# sparse is Djikstra's from every node (spf.py), fine for big topologies with few links per node
+# dense is Floyd-Warshall vectorised with numpy, faster on topologies with many links per node
+# while the n x n matrices fit in memory
+
+SPARSE = "sparse"
+DENSE = "dense"
+
+BACKENDS = (SPARSE, DENSE)
+
+# first hop stored by the dense backend for unreachable nodes and the node itself
+# bigger than every node id so it never wins a tie
+NO_HOP = 0xFFFFFFFFFFFFFFFF
+
+# biggest topology the dense backend is picked for by default
+# it keeps a few n x n matrices of 8 byte values so this is about 100MB
+DENSE_LIMIT = 2048
+
+# fewest links per node pair the dense backend is picked for by default
+# Floyd-Warshall is n^3 whatever the links while Djikstra's from every node grows with them,
+# on random topologies dense pulled ahead once about 1% of node pairs were linked (degree 4 at 400 nodes)
+DENSE_DENSITY = 0.01
+
+# backend used when none is asked for
+def defaultBackend(store):
+    n = len(store)
+    if numpy is not None and 0 < n <= DENSE_LIMIT and len(store.targets) / (n * n) >= DENSE_DENSITY:
+        return DENSE
+    return SPARSE
+
+# shortest paths from the node at index source (same as the emulator computes for its host)
+# returns ([distance], [firstHop]) by node index with None for unreachable nodes
+def singleSource(store, source):
+    return spf.shortestPaths(store, source)
+
+# shortest paths between every pair of nodes in store
+# backend is SPARSE, DENSE or None to pick one from the size and links of the topology
+def allPairs(store, backend=None):
+    if backend is None:
+        backend = defaultBackend(store)
+
+    if backend == SPARSE:
+        return _sparseAllPairs(store)
+    if backend == DENSE:
+        if numpy is None:
+            raise ValueError("the dense backend needs numpy")
+        return _denseAllPairs(store)
+    raise ValueError(f"unknown path compute backend {backend}")
+
+# distances and first hops between every pair of nodes
+# dist[source][dest] and firstHop[source][dest] are by node index
+# the sparse backend keeps lists with None for no path
+# the dense backend keeps numpy arrays with inf and NO_HOP for no path
+# either way ties on distance go to the smallest first hop id like the emulator
+class AllPairsPaths:
+    def __init__(self, store, backend, dist, firstHop):
+        self.store = store
+        self.backend = backend
+        self.dist = dist
+        self.firstHop = firstHop
+
+    def __len__(self):
+        return len(self.store)
+
+    # distance from source to dest (both indexes) or None if there is no path
+    def distance(self, source, dest):
+        d = self.dist[source][dest]
+        if d is None or d == float('inf'):
+            return None
+        return int(d)
+
+    # first hop id from source to dest (both indexes) or None if there is no path
+    def nextHop(self, source, dest):
+        hop = self.firstHop[source][dest]
+        if hop is None or hop == NO_HOP:
+            return None
+        return int(hop)
+
+    # [(dest id, next hop id)] of the forwarding table of the node at index source
+    # in node index order like the emulator keeps it
+    def forwardTable(self, source):
+        ids = self.store.ids
+        table = list()
+        for dest in range(len(self.store)):
+            hop = self.nextHop(source, dest)
+            if hop is not None:
+                table.append((ids[dest], hop))
+        return table
+
+def _sparseAllPairs(store):
+    dist = list()
+    firstHop = list()
+    for source in range(len(store)):
+        sourceDist, sourceHops = spf.shortestPaths(store, source)
+        dist.append(sourceDist)
+        firstHop.append(sourceHops)
+    return AllPairsPaths(store, SPARSE, dist, firstHop)
+
+# Floyd-Warshall over whole rows at a time
+# distances are floats so no path can be inf without adding up past the end of an int
+def _denseAllPairs(store):
+    n = len(store)
+    ids = numpy.array(store.ids, dtype=numpy.uint64)
+    targets = numpy.array(store.targets, dtype=numpy.intp)
+    costs = numpy.array(store.costs, dtype=numpy.float64)
+    up = numpy.frombuffer(bytes(store.up), dtype=numpy.uint8).astype(bool)
+    rows = numpy.repeat(numpy.arange(n), numpy.diff(numpy.array(store.offsets, dtype=numpy.intp)))
+
+    dist = numpy.full((n, n), numpy.inf)
+    firstHop = numpy.full((n, n), NO_HOP, dtype=numpy.uint64)
+
+    # direct links, every node pair has at most one slot
+    rows = rows[up]
+    targets = targets[up]
+    dist[rows, targets] = costs[up]
+    firstHop[rows, targets] = ids[targets]
+    numpy.fill_diagonal(dist, 0)
+    numpy.fill_diagonal(firstHop, NO_HOP)
+
+    for k in range(n):
+        throughK = dist[:, k, None] + dist[None, k, :]
+        hopK = numpy.broadcast_to(firstHop[:, k, None], (n, n))
+
+        # shorter through k or as short with a smaller first hop
+        better = throughK < dist
+        better |= (throughK == dist) & (hopK < firstHop) & (throughK != numpy.inf)
+
+        numpy.copyto(dist, throughK, where=better)
+        numpy.copyto(firstHop, hopK, where=better)
+
+    return AllPairsPaths(store, DENSE, dist, firstHop)
+
+# print the forwarding table of every node in a topology file
+# so a whole topology can be checked without starting an emulator for every node
+def main():
+    parser = argparse.ArgumentParser(description="Path Compute")
+
+    parser.add_argument("-f", "--filename", type=str, required=True, dest="fileName")
+    parser.add_argument("-b", "--backend", type=str, default=None, choices=BACKENDS, dest="backend") # default picks from topology size and links
+    parser.add_argument("-n", "--node", type=str, default=None, dest="node") # ip,port to only print one node
+
+    args = parser.parse_args()
+
+    try:
+        store = topologystore.TopologyStore(snapshot.readTopologyLinks(args.fileName))
+    except FileNotFoundError:
+        print(f"File {args.fileName} not found")
+        sys.exit()
+
+    if args.node is not None:
+        # one node only needs its own shortest paths
+        node = nodes.parseNode(args.node)
+        if node not in store.index:
+            print(f"{args.node} is not in {args.fileName}")
+            sys.exit()
+        source = store.index[node]
+        dist, firstHop = singleSource(store, source)
+        printTable(store, source, [(store.ids[dest], hop) for dest, hop in enumerate(firstHop) if hop is not None])
+        return
+
+    try:
+        paths = allPairs(store, args.backend)
+    except ValueError as e:
+        print(e)
+        sys.exit()
+
+    for source in range(len(store)):
+        printTable(store, source, paths.forwardTable(source))
+
+def printTable(store, source, table):
+    print(f"Forwarding Table of {nodes.nodeName(store.ids[source])}:\n")
+    for dest, nextHop in table:
+        print(f"{nodes.nodeName(dest)} {nodes.nodeName(nextHop)}")
+    print() # extra line for spacing
+
+if __name__ == "__main__":
+    main()
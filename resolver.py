@@ -0,0 +1,85 @@
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
+# host name resolution shared by the emulators and trace
+# every name is looked up once and kept for ttl seconds so big forwarding files with the same
+# few hosts on every line do not wait on a lookup per field
+# names from a hosts file (loadHosts) never expire so runs can be kept off DNS entirely
+
+# seconds a looked up name is kept
+ttl = 300.0
+
+# {name: (ip string, monotonic() it expires or None if it never does)}
+cache = dict()
+
+# most lookups done at the same time by resolveAll
+maxLookups = 16
+
+# ip string of name, looking it up if it is not cached
+# raises OSError naming it if it cannot be resolved
+def resolve(name):
+    entry = cache.get(name)
+    if entry is not None and (entry[1] is None or entry[1] > monotonic()):
+        return entry[0]
+
+    ip = _literal(name)
+    if ip is not None:
+        cache[name] = (ip, None)
+        return ip
+
+    try:
+        ip = socket.gethostbyname(name)
+    except OSError as e:
+        raise OSError(f"cannot resolve {name}: {e}")
+    cache[name] = (ip, monotonic() + ttl)
+    return ip
+
+# {name: ip string} of every name in names with the ones not cached looked up at the same time
+# raises OSError if any of them cannot be resolved
+def resolveAll(names):
+    now = monotonic()
+    resolved = dict()
+    toLookUp = set()
+
+    for name in names:
+        if name in resolved or name in toLookUp:
+            continue
+        entry = cache.get(name)
+        if entry is not None and (entry[1] is None or entry[1] > now):
+            resolved[name] = entry[0]
+        else:
+            toLookUp.add(name)
+
+    if len(toLookUp) == 1:
+        name = toLookUp.pop()
+        resolved[name] = resolve(name)
+    elif toLookUp:
+        with ThreadPoolExecutor(max_workers=min(maxLookups, len(toLookUp))) as pool:
+            for name, ip in zip(toLookUp, pool.map(resolve, toLookUp)):
+                resolved[name] = ip
+
+    return resolved
+
+# add every name in a hosts style file (ip name [alias ...] with # comments) to the cache
+# returns the number of names added
+def loadHosts(fileName):
+    added = 0
+    with open(fileName, 'r') as hostsFile:
+        for line in hostsFile:
+            vals = line.split('#', 1)[0].split()
+            if len(vals) < 2:
+                continue
+            if _literal(vals[0]) is None:
+                raise ValueError(f"{vals[0]} in {fileName} is not an ip address")
+            for name in vals[1:]:
+                cache[name] = (vals[0], None)
+                added += 1
+    return added
+
+# name as an ip string if it is already a dotted ip address otherwise None
+def _literal(name):
+    try:
+        return socket.inet_ntoa(socket.inet_aton(name)) if name.count('.') == 3 else None
+    except OSError:
+        return None
@@ -0,0 +1,334 @@
+import argparse
+import heapq
+import itertools
+import os
+import random
+import shlex
+import sys
+import types
+from time import perf_counter
+
+import metrics
+import nodes
+import pathcompute
+import snapshot
+import topologystore
+
+# discrete event simulation of a whole network of emulators in one process
+# emulator.py is loaded once for every node as its own module with a SimNode as its host (see hosts.py)
+# so every node runs the real packet handling, flooding and forwarding table code
+# the nodes share a virtual clock and send packets to each other through an event heap with a
+# delay and loss for every link, so a run with the same seed always does the same thing
+
+EMULATOR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "emulator.py")
+
+# event kinds
+DELIVER = 0 # packet arrives at a node
+WAKE = 1 # node has timers due
+CALL = 2 # callback of the simulation itself (failures)
+
+# one emulator in the simulation
+# it is the emulator's host (hosts.Host): its clock and its sockets (sendto and sendToAll)
+# it has no sockets to recieve on or select over, the simulator calls recievePacket and runs the timers itself
+class SimNode:
+    def __init__(self, sim, node, code, emulatorArgs, quiet):
+        self.sim = sim
+        self.node = node
+        self.addr = nodes.sockaddr(node)
+        self.argv = ["-p", str(self.addr[1]), "-f", "simulated"] + emulatorArgs
+        self.up = True
+        self.wakeAt = None # time of the WAKE event in the heap for this node or None
+        self.lastTable = None # forwarding table after the last event
+
+        self.module = types.ModuleType(f"emulator_{self.addr[1]}_{self.addr[0]}")
+        self.module.__file__ = EMULATOR_PATH
+        self.module.host = self
+        if quiet:
+            self.module.print = lambda *args, **kwargs: None
+        exec(code, self.module.__dict__)
+
+    def monotonic(self):
+        return self.sim.now
+
+    def wallTime(self):
+        return self.sim.epoch + self.sim.now
+
+    def ipAddr(self):
+        return self.addr[0]
+
+    # read once and shared by every node, it is never changed
+    def readTopology(self, fileName, sourceName):
+        return self.sim.topologyFile
+
+    def bind(self, addr, workers):
+        return (None, None, [])
+
+    def senders(self):
+        return (self, self)
+
+    def receiveBatch(self, count):
+        return None
+
+    def selector(self):
+        return None
+
+    def sendto(self, data, addr):
+        self.sim.send(self.node, data, addr)
+
+    def sendToAll(self, packet, addrs):
+        for addr in addrs:
+            self.sim.send(self.node, packet, addr)
+
+class Simulator:
+    # links is [(node, {next: cost})] like topologystore.readTopologyLinks
+    # delay and jitter are seconds, loss is the probability a packet is lost
+    def __init__(self, links, emulatorArgs=(), delay=0.001, jitter=0.0, loss=0.0, seed=1, quiet=True):
+        self.now = 0.0
+        self.epoch = 1700000000.0 # wall clock at time 0 (link state seqNos start from it)
+        self.delay = delay
+        self.jitter = jitter
+        self.loss = loss
+        self.random = random.Random(seed)
+        random.seed(seed) # bfd jitter uses the random module
+
+        self.events = list() # [(time, sequence number, kind, node id, data, addr)]
+        self.counter = itertools.count()
+        self.topologyFile = dict(links)
+        self.linkParams = dict() # {(node, next): (delay, jitter, loss)} for links that are not the default
+        self.failedLinks = set() # {(node, next)} both ways
+
+        self.sent = metrics.typeCounts() # [packets] by type byte
+        self.lost = 0 # lost to link loss
+        self.undeliverable = 0 # to nodes that are down, over failed links or to addresses that are not nodes
+        self.eventsRun = 0
+        self.tableChanges = 0
+        self.lastChange = 0.0 # time a forwarding table last changed
+
+        # every node with a line in the file is an emulator
+        code = compile(open(EMULATOR_PATH).read(), EMULATOR_PATH, 'exec')
+        self.nodes = dict() # {node id: SimNode}
+        self.addrs = dict() # {(ip string, port): node id}
+        for node, nextLinks in links:
+            self.nodes[node] = SimNode(self, node, code, list(emulatorArgs), quiet)
+            self.addrs[nodes.sockaddr(node)] = node
+
+    # set the delay, jitter and loss of the link between node and next both ways
+    def setLink(self, node, next, delay, jitter=0.0, loss=0.0):
+        self.linkParams[(node, next)] = (delay, jitter, loss)
+        self.linkParams[(next, node)] = (delay, jitter, loss)
+
+    # start every emulator at the current time
+    def start(self):
+        for simNode in self.nodes.values():
+            module = simNode.module
+            module.readtopology()
+            module.startMetrics()
+            module.startFibDeltas()
+            module.buildForwardTable()
+            module.startTimers()
+            self._afterEvent(simNode)
+
+    # call callback() at time
+    def at(self, time, callback):
+        heapq.heappush(self.events, (time, next(self.counter), CALL, None, callback, None))
+
+    # stop node at time, it drops everything sent to it from then on
+    def failNode(self, node, time):
+        def fail():
+            self.nodes[node].up = False
+        self.at(time, fail)
+
+    # stop every packet between node and next at time
+    def failLink(self, node, next, time):
+        def fail():
+            self.failedLinks.add((node, next))
+            self.failedLinks.add((next, node))
+        self.at(time, fail)
+
+    # send a packet from node to addr over the link between them
+    def send(self, node, data, addr):
+        self.sent[data[0]] += 1
+
+        dest = self.addrs.get(addr)
+        if dest is None or (node, dest) in self.failedLinks:
+            self.undeliverable += 1
+            return
+
+        delay, jitter, loss = self.linkParams.get((node, dest), (self.delay, self.jitter, self.loss))
+        if loss and self.random.random() < loss:
+            self.lost += 1
+            return
+        if jitter:
+            delay += self.random.uniform(0, jitter)
+
+        heapq.heappush(self.events, (self.now + delay, next(self.counter), DELIVER, dest, bytes(data), nodes.sockaddr(node)))
+
+    # run every event up to time until
+    def run(self, until):
+        events = self.events
+        while events and events[0][0] <= until:
+            time, seq, kind, node, data, addr = heapq.heappop(events)
+            self.now = time
+            self.eventsRun += 1
+
+            if kind == CALL:
+                data()
+                continue
+
+            simNode = self.nodes[node]
+            if not simNode.up:
+                if kind == DELIVER:
+                    self.undeliverable += 1
+                continue
+
+            if kind == DELIVER:
+                # the emulator rewrites packets in place so every copy gets its own buffer
+                simNode.module.recievePacket(bytearray(data), addr, time)
+            elif simNode.wakeAt != time:
+                continue # an earlier wake took its place
+            else:
+                simNode.wakeAt = None
+
+            simNode.module.timerHeap.runDue(time)
+            self._afterEvent(simNode)
+
+        self.now = max(self.now, until)
+
+    # note forwarding table changes and wake the node for its next timer
+    def _afterEvent(self, simNode):
+        module = simNode.module
+
+        table = module.forwardingTable
+        if table is not simNode.lastTable:
+            # buildForwardTable swaps in a new list every time so only compare when it was built
+            if simNode.lastTable is None or table != simNode.lastTable:
+                self.tableChanges += 1
+                self.lastChange = self.now
+            simNode.lastTable = table
+
+        deadline = module.timerHeap.nextDeadline()
+        if deadline is not None and (simNode.wakeAt is None or deadline < simNode.wakeAt):
+            deadline = max(deadline, self.now)
+            simNode.wakeAt = deadline
+            heapq.heappush(self.events, (deadline, next(self.counter), WAKE, simNode.node, None, None))
+
+    # [node id] of every node whose forwarding table is not the shortest paths of the network
+    # as it is now (without failed nodes and links)
+    def wrongTables(self):
+        store = topologystore.TopologyStore(list(self.topologyFile.items()))
+        for node, simNode in self.nodes.items():
+            for next in store.neighbors(store.index[node]):
+                nextId = store.ids[next]
+                down = not simNode.up or (node, nextId) in self.failedLinks or \
+                    (nextId in self.nodes and not self.nodes[nextId].up)
+                if down:
+                    store.setLink(store.index[node], next, sys.maxsize)
+                    store.setLink(next, store.index[node], sys.maxsize)
+
+        wrong = list()
+        for node, simNode in self.nodes.items():
+            if not simNode.up:
+                continue
+            dist, firstHop = pathcompute.singleSource(store, store.index[node])
+            expected = {store.ids[i]: hop for i, hop in enumerate(firstHop) if hop is not None}
+            actual = {dest: hop for dest, hop in simNode.module.forwardingTable if dest is not None and hop is not None}
+            if expected != actual:
+                wrong.append(node)
+        return wrong
+
+# [(node, {next: cost})] of a random connected topology
+# a ring so every node is reachable with random links added until nodes have degree links on average
+def generateTopology(count, degree, seed):
+    rand = random.Random(seed)
+    ids = [nodes.internNode(f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", 3000) for i in range(count)]
+    links = {node: dict() for node in ids}
+
+    def link(a, b):
+        cost = rand.randint(1, 10)
+        links[ids[a]][ids[b]] = cost
+        links[ids[b]][ids[a]] = cost
+
+    for i in range(count):
+        link(i, (i + 1) % count)
+    for i in range(max(0, count * (degree - 2) // 2)):
+        a, b = rand.randrange(count), rand.randrange(count)
+        if a != b and ids[b] not in links[ids[a]]:
+            link(a, b)
+
+    return list(links.items())
+
+# (at time, node, next or None) from "ip,port@seconds" or "ip,port/ip,port@seconds"
+def parseFailure(text):
+    where, time = text.rsplit('@', 1)
+    ends = where.split('/')
+    return (float(time), nodes.parseNode(ends[0]), nodes.parseNode(ends[1]) if len(ends) > 1 else None)
+
+def main():
+    parser = argparse.ArgumentParser(description="Link State Routing Simulator")
+
+    parser.add_argument("-f", "--filename", type=str, default=None, dest="fileName") # topology file or snapshot
+    parser.add_argument("-g", "--generate", type=int, default=0, dest="generate") # nodes in a random topology instead of a file
+    parser.add_argument("-k", "--degree", type=int, default=4, dest="degree") # average links of every node in a random topology
+    parser.add_argument("-T", "--duration", type=float, default=30.0, dest="duration") # simulated seconds
+    parser.add_argument("-l", "--delay", type=float, default=1.0, dest="delay") # milliseconds every link delays packets
+    parser.add_argument("-j", "--jitter", type=float, default=0.0, dest="jitter") # up to this many milliseconds more
+    parser.add_argument("-L", "--loss", type=float, default=0.0, dest="loss") # percent of packets lost on every link
+    parser.add_argument("-s", "--seed", type=int, default=1, dest="seed")
+    parser.add_argument("-F", "--fail", type=str, action="append", default=[], dest="failures") # ip,port@seconds or ip,port/ip,port@seconds
+    parser.add_argument("-e", "--emulator_args", type=str, default="", dest="emulatorArgs") # options for every emulator like "-m -a"
+    parser.add_argument("-V", "--verify", action="store_true", dest="verify") # check every forwarding table against shortest paths at the end
+    parser.add_argument("-v", "--verbose", action="store_true", dest="verbose") # let the emulators print
+
+    args = parser.parse_args()
+
+    if (args.fileName is None) == (args.generate <= 0):
+        print("Give either a topology file or a number of nodes to generate.")
+        sys.exit()
+
+    try:
+        if args.fileName is not None:
+            links = snapshot.readTopologyLinks(args.fileName)
+        else:
+            links = generateTopology(args.generate, args.degree, args.seed)
+        failures = sorted(parseFailure(text) for text in args.failures)
+    except FileNotFoundError:
+        print(f"File {args.fileName} not found")
+        sys.exit()
+    except ValueError as e:
+        print(f"Bad failure: {e}")
+        sys.exit()
+
+    start = perf_counter()
+    sim = Simulator(links, shlex.split(args.emulatorArgs), args.delay / 1000, args.jitter / 1000, args.loss / 100,
+                    args.seed, not args.verbose)
+    for time, node, next in failures:
+        if next is None:
+            sim.failNode(node, time)
+        else:
+            sim.failLink(node, next, time)
+    sim.start()
+    print(f"Started {len(sim.nodes)} emulators in {perf_counter() - start:.2f}s")
+
+    # run up to every failure to see how long the network took to settle before it
+    lastTime = 0.0
+    for time, node, next in failures + [(args.duration, None, None)]:
+        sim.run(time - 1e-9)
+        what = "end" if node is None else f"failure of {nodes.nodeName(node)}" + ("" if next is None else f"/{nodes.nodeName(next)}")
+        print(f"Last forwarding table change before {what} at {time:.3f}s: {sim.lastChange:.3f}s ({sim.lastChange - lastTime:.3f}s after {lastTime:.3f}s)")
+        lastTime = time
+    sim.run(args.duration)
+
+    elapsed = perf_counter() - start
+    print(f"Simulated {args.duration:.1f}s in {elapsed:.2f}s ({sim.eventsRun} events)")
+    print(f"Forwarding table changes: {sim.tableChanges}")
+    print("Packets sent: " + ", ".join(f"{metrics.typeName(pType)} {count}" for pType, count in enumerate(sim.sent) if count))
+    print(f"Packets lost: {sim.lost}, undeliverable: {sim.undeliverable}")
+
+    if args.verify:
+        wrong = sim.wrongTables()
+        print(f"Forwarding tables that are not shortest paths: {len(wrong)}")
+        for node in wrong[:10]:
+            print(f"  {nodes.nodeName(node)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+import argparse
+import bisect
+import hashlib
+import mmap
+import os
+import socket
+import struct
+import sys
+
+import nodes
+import resolver
+import topologystore
+
+# compiled topology and forwarding files
+# the text files are parsed, checked and resolved once by this script and written out as a
+# binary snapshot that emulators mmap read only, so none of them parse text or look up host names
+# the rows are copied out of the map when a snapshot is loaded (emulators build their own
+# topology from them and change it as links come and go) so pages are only shared while loading
+# a snapshot keeps the sha256 of the text file it was compiled from so a stale one can be found
+#
+# snapshot format (all host byte order):
+# header: magic 8B, version 2B, kind 2B, rows 4B, entries 4B, sha256 of the text file 32B
+# row nodes: node id 8B for every row
+# row offsets: 4B for every row and one more, row i has entries offsets[i] to offsets[i + 1]
+# entries: TOPOLOGY_ENTRY or FORWARDING_ENTRY for the kind
+#
+# topology rows are in the order of the lines of the file, forwarding rows are sorted by
+# emulator so one emulator can find its own row without reading the rest
+
+MAGIC = b'LSRSNAP\0'
+VERSION = 1
+
+TOPOLOGY = 1 # lines of ip,port ip,port,cost ... (emulator.py)
+FORWARDING = 2 # lines of host port destHost destPort nextHost nextPort delay loss (old_emulator.py)
+
+HEADER = struct.Struct('=8sHHII32s')
+NODE = struct.Struct('=Q')
+OFFSET = struct.Struct('=I')
+TOPOLOGY_ENTRY = struct.Struct('=QI') # next node id, cost
+FORWARDING_ENTRY = struct.Struct('=QQII') # dest node id, next hop node id, delay ms, loss percent
+
+ENTRIES = {TOPOLOGY: TOPOLOGY_ENTRY, FORWARDING: FORWARDING_ENTRY}
+
+# True if fileName starts like a snapshot
+def isSnapshot(fileName):
+    with open(fileName, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+# a snapshot mapped read only
+# raises ValueError if the file is not a snapshot or does not add up
+class Snapshot:
+    def __init__(self, fileName):
+        with open(fileName, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            self._check()
+        except:
+            self.map.close()
+            raise
+
+    def _check(self):
+        if len(self.map) < HEADER.size:
+            raise ValueError("snapshot is too short")
+
+        magic, version, self.kind, self.rows, self.entries, self.digest = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError("not a snapshot")
+        if version != VERSION:
+            raise ValueError(f"snapshot version {version} is not supported")
+        if self.kind not in ENTRIES:
+            raise ValueError(f"unknown snapshot kind {self.kind}")
+
+        self.entry = ENTRIES[self.kind]
+        self.nodesAt = HEADER.size
+        self.offsetsAt = self.nodesAt + self.rows * NODE.size
+        self.entriesAt = self.offsetsAt + (self.rows + 1) * OFFSET.size
+        if len(self.map) != self.entriesAt + self.entries * self.entry.size:
+            raise ValueError("snapshot size does not match its header")
+
+        view = memoryview(self.map)
+        self.nodes = view[self.nodesAt:self.offsetsAt].cast('Q')
+        self.offsets = view[self.offsetsAt:self.entriesAt].cast('I')
+        if self.offsets[0] != 0 or self.offsets[self.rows] != self.entries:
+            raise ValueError("snapshot row offsets do not match its header")
+
+    def __len__(self):
+        return self.rows
+
+    def close(self):
+        self.nodes.release()
+        self.offsets.release()
+        self.map.close()
+
+    # sha256 of the text file it was compiled from as hex
+    def hexdigest(self):
+        return self.digest.hex()
+
+    # raises ValueError if sourceName is not the text file as it was when this was compiled
+    def checkSource(self, sourceName):
+        if fileDigest(sourceName) != self.hexdigest():
+            raise ValueError(f"snapshot is stale, {sourceName} changed since it was compiled")
+
+    # [entry tuple] of row i
+    def row(self, i):
+        start = self.entriesAt + self.offsets[i] * self.entry.size
+        end = self.entriesAt + self.offsets[i + 1] * self.entry.size
+        return list(self.entry.iter_unpack(self.map[start:end]))
+
+    # index of the row for node or None if there is none (forwarding snapshots only)
+    def find(self, node):
+        i = bisect.bisect_left(self.nodes, node)
+        if i < self.rows and self.nodes[i] == node:
+            return i
+        return None
+
+    # [(node, {next: cost})] of a topology snapshot like topologystore.readTopologyLinks
+    def topologyLinks(self):
+        if self.kind != TOPOLOGY:
+            raise ValueError("not a topology snapshot")
+        return [(self.nodes[i], dict(self.row(i))) for i in range(self.rows)]
+
+    # {dest: [(nextHop, delay in seconds, loss probability)]} of the emulator node
+    # in a forwarding snapshot like old_emulator.readTracker
+    def forwardingTable(self, node):
+        if self.kind != FORWARDING:
+            raise ValueError("not a forwarding snapshot")
+
+        table = dict()
+        i = self.find(node)
+        if i is None:
+            return table
+
+        for dest, nextHop, delay, loss in self.row(i):
+            if dest not in table:
+                table[dest] = list()
+            table[dest].append((nextHop, delay / 1000, loss / 100))
+        return table
+
+# sha256 of a file as hex like the one kept in snapshots compiled from it
+def fileDigest(fileName):
+    with open(fileName, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+# [(node, {next: cost})] from a topology file or a topology snapshot
+# a snapshot is checked against sourceName if it is given (raises ValueError if it is stale)
+def readTopologyLinks(fileName, sourceName=None):
+    if not isSnapshot(fileName):
+        return topologystore.readTopologyLinks(fileName)
+
+    topologySnapshot = Snapshot(fileName)
+    try:
+        if sourceName is not None:
+            topologySnapshot.checkSource(sourceName)
+        return topologySnapshot.topologyLinks()
+    finally:
+        topologySnapshot.close()
+
+# [(node, [entry tuple])] of a topology file with every line checked
+# raises ValueError naming the line that is wrong
+def compileTopology(lines):
+    rows = list()
+    seen = set()
+
+    for lineNo, line in enumerate(lines, 1):
+        vals = line.split()
+        if not vals:
+            continue
+
+        try:
+            node = _topologyNode(vals[0], 2)
+            entries = list()
+            nexts = set()
+            for val in vals[1:]:
+                next = _topologyNode(val, 3)
+                cost = int(val.split(',')[2])
+                if cost < 0 or cost >= topologystore.NO_LINK:
+                    raise ValueError(f"cost {cost} out of range")
+                if next in nexts:
+                    raise ValueError(f"{val} is linked twice")
+                nexts.add(next)
+                entries.append((next, cost))
+        except ValueError as e:
+            raise ValueError(f"line {lineNo}: {e}")
+
+        if node in seen:
+            raise ValueError(f"line {lineNo}: {vals[0]} already has a line")
+        seen.add(node)
+        rows.append((node, entries))
+
+    return rows
+
+def _topologyNode(val, fields):
+    parts = val.split(',')
+    if len(parts) != fields:
+        raise ValueError(f"{val} is not {'ip,port' if fields == 2 else 'ip,port,cost'}")
+    try:
+        socket.inet_aton(parts[0])
+    except OSError:
+        raise ValueError(f"{parts[0]} is not an ip address")
+    return nodes.internNode(parts[0], _port(parts[1]))
+
+# [(emulator node, [entry tuple])] of a forwarding file sorted by emulator
+# every host name is looked up once with resolver.py
+# raises ValueError naming the line that is wrong
+def compileForwarding(lines):
+    rows = dict()
+
+    hosts = [vals[i] for vals in map(str.split, lines) if len(vals) == 8 for i in (0, 2, 4)]
+    try:
+        resolved = resolver.resolveAll(hosts) # {host name: ip string}
+    except OSError as e:
+        raise ValueError(str(e))
+
+    def resolve(host):
+        if host not in resolved:
+            raise ValueError(f"cannot resolve {host}")
+        return resolved[host]
+
+    for lineNo, line in enumerate(lines, 1):
+        vals = line.split()
+        if not vals:
+            continue
+
+        try:
+            if len(vals) != 8:
+                raise ValueError("expected host port destHost destPort nextHost nextPort delay loss")
+            node = nodes.internNode(resolve(vals[0]), _port(vals[1]))
+            dest = nodes.internNode(resolve(vals[2]), _port(vals[3]))
+            nextHop = nodes.internNode(resolve(vals[4]), _port(vals[5]))
+            delay = int(vals[6])
+            loss = int(vals[7])
+            if delay < 0 or delay > 0xFFFFFFFF:
+                raise ValueError(f"delay {delay} out of range")
+            if loss < 0 or loss > 100:
+                raise ValueError(f"loss {loss} out of range")
+        except ValueError as e:
+            raise ValueError(f"line {lineNo}: {e}")
+
+        rows.setdefault(node, list()).append((dest, nextHop, delay, loss))
+
+    return sorted(rows.items())
+
+def _port(val):
+    port = int(val)
+    if port < 1 or port > 0xFFFF:
+        raise ValueError(f"port {port} out of range")
+    return port
+
+# compile the text file inName into a snapshot at outName
+# returns (rows written, sha256 of the text file as hex)
+def compileFile(inName, outName, kind):
+    with open(inName, 'rb') as inFile:
+        text = inFile.read()
+    digest = hashlib.sha256(text).digest()
+    lines = text.decode().splitlines()
+
+    if kind == TOPOLOGY:
+        rows = compileTopology(lines)
+    else:
+        rows = compileForwarding(lines)
+
+    entry = ENTRIES[kind]
+    offsets = [0]
+    for node, entries in rows:
+        offsets.append(offsets[-1] + len(entries))
+
+    out = bytearray(HEADER.pack(MAGIC, VERSION, kind, len(rows), offsets[-1], digest))
+    for node, entries in rows:
+        out += NODE.pack(node)
+    for offset in offsets:
+        out += OFFSET.pack(offset)
+    for node, entries in rows:
+        for values in entries:
+            out += entry.pack(*values)
+
+    # write next to it and rename so emulators never map a half written snapshot
+    with open(outName + ".tmp", 'wb') as outFile:
+        outFile.write(out)
+    os.replace(outName + ".tmp", outName)
+
+    return (len(rows), digest.hex())
+
+def main():
+    parser = argparse.ArgumentParser(description="Topology Compiler")
+
+    parser.add_argument("-f", "--filename", type=str, required=True, dest="fileName")
+    parser.add_argument("-o", "--output", type=str, required=True, dest="outName")
+    parser.add_argument("-k", "--kind", type=str, default="topology", choices=("topology", "forwarding"), dest="kind")
+    parser.add_argument("-H", "--hosts", type=str, default=None, dest="hostsName") # hosts style file to resolve names from
+    parser.add_argument("-c", "--check", action="store_true", dest="check") # only check the output was compiled from the file as it is now
+
+    args = parser.parse_args()
+
+    if args.check:
+        try:
+            outSnapshot = Snapshot(args.outName)
+            try:
+                outSnapshot.checkSource(args.fileName)
+            finally:
+                outSnapshot.close()
+        except FileNotFoundError as e:
+            print(f"File {e.filename} not found")
+            sys.exit(1)
+        except ValueError as e:
+            print(f"{args.outName} {e}")
+            sys.exit(1)
+        print(f"{args.outName} is up to date with {args.fileName}")
+        return
+
+    kind = TOPOLOGY if args.kind == "topology" else FORWARDING
+    try:
+        if args.hostsName is not None:
+            resolver.loadHosts(args.hostsName)
+        rows, digest = compileFile(args.fileName, args.outName, kind)
+    except FileNotFoundError as e:
+        print(f"File {e.filename} not found")
+        sys.exit(1)
+    except ValueError as e:
+        print(f"{args.fileName} {e}")
+        sys.exit(1)
+
+    print(f"Compiled {rows} rows of {args.fileName} ({digest}) into {args.outName}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+import heapq
+import sys
+
+# shortest path first computations for the link state emulator
+# graphs are topologystore.TopologyStore and nodes are their indexes
+
+# Djikstra's from source over the links that are up in store
+# returns ([distance], [firstHop]) by node index with None for unreachable nodes
+# first hops are node ids (source has firstHop None)
+def shortestPaths(store, source):
+    tree = ShortestPathTree(store, source)
+    return (tree.dist, tree.firstHop)
+
+# shortest path tree from one source that can be repaired when a single link changes
+# uses a binary heap of (distance, firstHop, node, parent) with lazy deletion of stale entries
+# ties on distance go to the smallest first hop id which matches the old sorted path list
+class ShortestPathTree:
+    def __init__(self, store, source):
+        self.store = store
+        self.source = source
+        self.dist = list() # [distance] or None if unreachable
+        self.firstHop = list() # [first hop node id] or None if unreachable
+        self.parent = list() # [previous node on the path] or None
+        self.compute()
+
+    # full recompute from scratch
+    # returns the set of nodes whose first hop changed
+    def compute(self):
+        oldFirstHop = self.firstHop
+        n = len(self.store)
+
+        self.dist = [None] * n
+        self.firstHop = [None] * n
+        self.parent = [None] * n
+
+        self._settle([(0, None, self.source, None)], None)
+
+        changed = set()
+        for node in range(n):
+            old = oldFirstHop[node] if node < len(oldFirstHop) else None
+            if old != self.firstHop[node]:
+                changed.add(node)
+        return changed
+
+    # repair the tree after every (node, next) link in links changed (went down, came back or new cost)
+    # only the part of the tree that can be affected by the links is recomputed
+    # returns the set of nodes whose first hop is different from before any of the changes
+    def linksChanged(self, links):
+        old = dict()
+        for node, next in links:
+            self._linkChanged(node, next, old)
+        return self._changed(old)
+
+    def _linkChanged(self, node, next, old):
+        if next == self.source or self.dist[node] is None:
+            return
+
+        cost = self.store.linkCost(node, next)
+        oldLabel = self._label(next)
+
+        if cost != sys.maxsize:
+            newLabel = self._candidate(node, next, cost)
+
+            # link got cheaper or came back
+            if newLabel < oldLabel:
+                heap = [(newLabel[0], newLabel[1], next, node)]
+                self._settle(heap, old)
+                return
+        else:
+            newLabel = None
+
+        # link got more expensive or went down
+        # only matters if it was the link used to reach next
+        if self.parent[next] != node or newLabel == oldLabel:
+            return
+
+        self._repairSubtree(next, old)
+
+    # (distance, firstHop) of node or infinity if it is unreachable
+    def _label(self, node):
+        if self.dist[node] is None:
+            return (sys.maxsize, -1)
+        return (self.dist[node], self.firstHop[node])
+
+    # (distance, firstHop) of reaching next through node
+    def _candidate(self, node, next, cost):
+        hop = self.firstHop[node]
+        return (self.dist[node] + cost, self.store.ids[next] if hop is None else hop)
+
+    # pop entries off heap until it is empty setting any node whose label improves
+    # if old is a dict it is filled with the first hops of nodes that were overwritten
+    def _settle(self, heap, old):
+        dist = self.dist
+        firstHop = self.firstHop
+        parent = self.parent
+        store = self.store
+        offsets = store.offsets
+        targets = store.targets
+        costs = store.costs
+        up = store.up
+        ids = store.ids
+        best = dict() # best tentative (distance, firstHop) for nodes in heap
+
+        heapq.heapify(heap)
+
+        while heap:
+            d, hop, node, prev = heapq.heappop(heap)
+
+            if dist[node] is not None:
+                # stale entry or label did not improve
+                if old is None or (d, hop) >= (dist[node], firstHop[node]):
+                    continue
+                if node not in old:
+                    old[node] = firstHop[node]
+            elif old is not None and node not in old:
+                old[node] = None
+
+            dist[node] = d
+            firstHop[node] = hop
+            parent[node] = prev
+
+            for e in range(offsets[node], offsets[node + 1]):
+                # do not add links that are down
+                if not up[e]:
+                    continue
+
+                next = targets[e]
+                nextDist = d + costs[e]
+                nextHop = ids[next] if hop is None else hop
+                candidate = (nextDist, nextHop)
+
+                # only push entries that improve on what is already known
+                if dist[next] is not None and (old is None or candidate >= (dist[next], firstHop[next])):
+                    continue
+                queued = best.get(next)
+                if queued is not None and queued <= candidate:
+                    continue
+
+                best[next] = candidate
+                heapq.heappush(heap, (nextDist, nextHop, next, node))
+
+    # recompute every node below root in the tree after the link into root got worse
+    # old is filled with the first hops of nodes that were recomputed
+    def _repairSubtree(self, root, old):
+        store = self.store
+        offsets = store.offsets
+        targets = store.targets
+        dist = self.dist
+        firstHop = self.firstHop
+        parent = self.parent
+
+        # find the subtree hanging off root
+        subtree = [root]
+        inSubtree = {root}
+        i = 0
+        while i < len(subtree):
+            node = subtree[i]
+            i += 1
+            for e in range(offsets[node], offsets[node + 1]):
+                next = targets[e]
+                if next not in inSubtree and parent[next] == node:
+                    inSubtree.add(next)
+                    subtree.append(next)
+
+        # forget everything about the subtree
+        for node in subtree:
+            if node not in old:
+                old[node] = firstHop[node]
+            dist[node] = None
+            firstHop[node] = None
+            parent[node] = None
+
+        # reconnect the subtree through the best link from outside of it
+        # every link has a slot both ways so the nodes linking to node are the targets of its own slots
+        heap = list()
+        for node in subtree:
+            for e in range(offsets[node], offsets[node + 1]):
+                prev = targets[e]
+                if prev in inSubtree or dist[prev] is None:
+                    continue
+                cost = store.linkCost(prev, node)
+                if cost == sys.maxsize:
+                    continue
+                label = self._candidate(prev, node, cost)
+                heap.append((label[0], label[1], node, prev))
+
+        self._settleSubtree(heap, inSubtree, old)
+
+    # Djikstra's that only settles nodes in the subtree being repaired
+    # nothing outside the subtree can get better when a single link gets worse
+    # but when several links changed at once the subtree may have been reconnected through
+    # a cheaper link that has not been looked at yet so improvements outside are propagated after
+    def _settleSubtree(self, heap, inSubtree, old):
+        dist = self.dist
+        firstHop = self.firstHop
+        parent = self.parent
+        store = self.store
+        offsets = store.offsets
+        targets = store.targets
+        costs = store.costs
+        up = store.up
+        outside = list() # entries that improve nodes outside the subtree
+
+        heapq.heapify(heap)
+
+        while heap:
+            d, hop, node, prev = heapq.heappop(heap)
+
+            if dist[node] is not None: # stale entry
+                continue
+
+            dist[node] = d
+            firstHop[node] = hop
+            parent[node] = prev
+
+            for e in range(offsets[node], offsets[node + 1]):
+                if not up[e]:
+                    continue
+
+                next = targets[e]
+                if next in inSubtree:
+                    if dist[next] is None:
+                        heapq.heappush(heap, (d + costs[e], hop, next, node))
+                elif (d + costs[e], hop) < self._label(next):
+                    outside.append((d + costs[e], hop, next, node))
+
+        if outside:
+            self._settle(outside, old)
+
+    # nodes in old whose first hop is now different
+    def _changed(self, old):
+        changed = set()
+        for node, hop in old.items():
+            if self.firstHop[node] != hop:
+                changed.add(node)
+        return changed
+
+# every equal cost first hop of every node from the distances of a shortest path tree from source
+# returns [tuple of first hop ids] by node index, empty for source and unreachable nodes
+# nodes are gone through closest first so every node has its hops before it passes them on
+def equalCostHops(store, source, dist):
+    offsets = store.offsets
+    targets = store.targets
+    costs = store.costs
+    up = store.up
+    ids = store.ids
+
+    hops = [None] * len(dist) # [set of first hops]
+    order = sorted((d, node) for node, d in enumerate(dist) if d is not None)
+
+    for d, node in order:
+        nodeHops = hops[node]
+        for e in range(offsets[node], offsets[node + 1]):
+            if not up[e]:
+                continue
+
+            next = targets[e]
+            if dist[next] is None or d + costs[e] != dist[next] or next == source:
+                continue # not on a shortest path to next
+
+            if hops[next] is None:
+                hops[next] = set()
+            if node == source:
+                hops[next].add(ids[next])
+            elif nodeHops:
+                hops[next].update(nodeHops)
+
+    return [tuple(sorted(nodeHops)) if nodeHops else () for nodeHops in hops]
+
+# loop free alternate (RFC 5286) of every node for when the link to its first hop goes down
+# dist and firstHop are from a shortest path tree from source
+# a neighbor is an alternate for dest if its shortest path to dest does not come back through source
+# alternates that also avoid the first hop node are picked over ones that only avoid the link
+# returns [alternate neighbor id or None] by node index
+def loopFreeAlternates(store, source, dist, firstHop):
+    ids = store.ids
+    index = store.index
+    links = store.links(source)
+
+    # distances from every neighbor
+    neighborDist = dict()
+    for neighbor, cost in links:
+        neighborDist[neighbor] = shortestPaths(store, neighbor)[0]
+
+    alternates = [None] * len(dist)
+    for dest in range(len(dist)):
+        if dest == source or firstHop[dest] is None:
+            continue
+
+        primary = index[firstHop[dest]]
+        primaryDist = neighborDist.get(primary)
+        best = None
+
+        for neighbor, cost in links:
+            if neighbor == primary:
+                continue
+
+            nDist = neighborDist[neighbor]
+            if nDist[dest] is None:
+                continue
+
+            # loop free: dist(N, D) < dist(N, S) + dist(S, D)
+            if nDist[source] is not None and nDist[dest] >= nDist[source] + dist[dest]:
+                continue
+
+            # node protecting: dist(N, D) < dist(N, P) + dist(P, D)
+            protectsNode = dest != primary and primaryDist is not None and primaryDist[dest] is not None and \
+                (nDist[primary] is None or nDist[dest] < nDist[primary] + primaryDist[dest])
+
+            candidate = (not protectsNode, cost + nDist[dest], ids[neighbor])
+            if best is None or candidate < best:
+                best = candidate
+
+        if best is not None:
+            alternates[dest] = best[2]
+
+    return alternates
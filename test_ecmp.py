@@ -0,0 +1,44 @@
+import random
+
+import nodes
+import packets
+import spf
+from test_spf import randomStore
+
+# equal cost next hops checked against brute force and the flow hash
+# run with python -m pytest
+
+GRAPHS = 300
+
+def test_equal_cost_hops_are_every_shortest_first_hop():
+    rand = random.Random(2)
+    for graph in range(GRAPHS):
+        store = randomStore(rand, rand.randint(2, 25), rand.randint(2, 6))
+        source = rand.randrange(len(store))
+        dist, firstHop = spf.shortestPaths(store, source)
+        hops = spf.equalCostHops(store, source, dist)
+
+        neighborDist = {next: spf.shortestPaths(store, next)[0] for next, cost in store.links(source)}
+        for dest in range(len(store)):
+            expected = set()
+            if dest != source and dist[dest] is not None:
+                for next, cost in store.links(source):
+                    if neighborDist[next][dest] is not None and cost + neighborDist[next][dest] == dist[dest]:
+                        expected.add(store.ids[next])
+
+            assert hops[dest] == tuple(sorted(expected))
+            if expected:
+                assert firstHop[dest] == min(expected)
+
+# flows one router sends to its first hop are split again by the next router
+def test_flow_hash_is_different_on_every_router():
+    flows = [packets.ROUTE_TRACE.pack(0, 0x0A000000 + i, 4000 + i % 7, 0x0A640001, 5000, 0, 0, 0) for i in range(4000)]
+    first = packets.hashSeed(nodes.internNode("10.0.0.1", 3000))
+    second = packets.hashSeed(nodes.internNode("10.0.0.2", 3000))
+    hops = ['a', 'b']
+
+    assert all(packets.pickNextHop(flow, hops, first) == packets.pickNextHop(flow, hops, first) for flow in flows)
+    firstA = [flow for flow in flows if packets.pickNextHop(flow, hops, first) == 'a']
+    assert 1800 < len(firstA) < 2200
+    secondA = [flow for flow in firstA if packets.pickNextHop(flow, hops, second) == 'a']
+    assert 0.4 * len(firstA) < len(secondA) < 0.6 * len(firstA)
@@ -0,0 +1,50 @@
+import random
+
+import spf
+from test_spf import randomStore
+
+# loop-free alternates checked against every node's own shortest paths
+# run with python -m pytest
+
+GRAPHS = 300
+
+# node ids a packet from node to dest goes through following every node's own first hop
+# or None if it loops or dead ends
+def forwardingPath(store, firstHops, node, dest):
+    path = [node]
+    while node != dest:
+        hop = firstHops[node][dest]
+        if hop is None or len(path) > len(store):
+            return None
+        node = store.index[hop]
+        path.append(node)
+    return path
+
+def test_loop_free_alternates_never_come_back_through_source():
+    rand = random.Random(3)
+    for graph in range(GRAPHS):
+        store = randomStore(rand, rand.randint(2, 20), rand.randint(2, 6))
+        source = rand.randrange(len(store))
+        dist, firstHop = spf.shortestPaths(store, source)
+        alternates = spf.loopFreeAlternates(store, source, dist, firstHop)
+        firstHops = [spf.shortestPaths(store, node)[1] for node in range(len(store))]
+        allDist = [spf.shortestPaths(store, node)[0] for node in range(len(store))]
+
+        for dest in range(len(store)):
+            if dest == source or firstHop[dest] is None:
+                assert alternates[dest] is None
+                continue
+
+            primary = store.index[firstHop[dest]]
+            loopFree = [next for next, cost in store.links(source) if next != primary and
+                        allDist[next][dest] is not None and
+                        (allDist[next][source] is None or allDist[next][dest] < allDist[next][source] + dist[dest])]
+
+            if not loopFree:
+                assert alternates[dest] is None
+                continue
+
+            alternate = store.index[alternates[dest]]
+            assert alternate in loopFree
+            path = forwardingPath(store, firstHops, alternate, dest)
+            assert path is not None and source not in path
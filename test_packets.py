@@ -0,0 +1,75 @@
+import socket
+import sys
+
+import nodes
+import packets
+
+# headers are byte for byte what the original htonl/to_bytes code sent
+# and link state data survives an encode and decode
+# run with python -m pytest
+
+def node(port):
+    return nodes.internNode("10.1.2.3", port)
+
+IPS = [0, 1, 0x7F000001, 0x0A010203, 0xC0A80A01, 0xFFFFFFFF]
+PORTS = [0, 1, 5001, 0x1234, 65535]
+
+# header fields the way the original emulator and trace built them
+def long(x):
+    return socket.htonl(x).to_bytes(4, 'big')
+
+def short(x):
+    return socket.htons(x).to_bytes(2, 'big')
+
+def test_hello_matches_original():
+    for ip in IPS:
+        for port in PORTS:
+            original = ord('H').to_bytes(1, 'big') + long(ip) + short(port)
+            assert packets.HELLO.pack(ord('H'), ip, port) == original
+            assert packets.HELLO.unpack(original) == (ord('H'), ip, port)
+
+def test_link_state_matches_original():
+    data = packets.encodeLinkState([(node(5001), 3)])
+    for ip in IPS:
+        for port in PORTS:
+            original = (ord('L').to_bytes(1, 'big') + long(ip) + short(port) + long(0x0A000001) + short(port ^ 0xFF) +
+                        long(ip ^ 0x1234567) + long(17) + long(len(data)) + data)
+            header = packets.LINK_STATE.pack(ord('L'), ip, port, 0x0A000001, port ^ 0xFF, ip ^ 0x1234567, 17, len(data))
+            assert header + data == original
+            assert packets.LINK_STATE_ORIGIN.unpack_from(original, packets.SRC_OFFSET) == (ip, port, ip ^ 0x1234567)
+
+            # forwarding rewrites last sender and TTL in place
+            packet = bytearray(original)
+            packets.rewriteLinkState(packet, ip, port, 16)
+            assert bytes(packet) == original[:7] + long(ip) + short(port) + original[13:17] + long(16) + original[21:]
+
+def test_route_trace_matches_original():
+    for ip in IPS:
+        for port in PORTS:
+            original = (ord('T').to_bytes(1, 'big') + long(ip) + short(port) + long(0x7F000001) + short(5004) +
+                        long(ip ^ 0xFFFF) + short(port ^ 1) + long(9))
+            assert packets.ROUTE_TRACE.pack(ord('T'), ip, port, 0x7F000001, 5004, ip ^ 0xFFFF, port ^ 1, 9) == original
+
+            packet = bytearray(original)
+            packets.rewriteRouteTrace(packet, 8)
+            assert bytes(packet) == original[:19] + long(8)
+            assert packets.routeTraceProbe(packet) is None
+
+def test_link_state_round_trip():
+    links = [(node(5001), 1), (node(5002), 70000), (node(65535), sys.maxsize), (node(5004), packets.INFINITE_LINK)]
+    data = packets.encodeLinkState(links)
+
+    assert len(data) == packets.LINK_ENTRY.size * len(links)
+    assert data[:packets.LINK_ENTRY.size] == bytes([10, 1, 2, 3, 0x13, 0x89, 0, 0, 0, 1])
+    assert data[2 * packets.LINK_ENTRY.size:3 * packets.LINK_ENTRY.size] == bytes([10, 1, 2, 3, 0xFF, 0xFF]) + b'\xff' * 4
+    assert packets.decodeLinkState(data) == {
+        node(5001): 1,
+        node(5002): 70000,
+        node(65535): sys.maxsize,
+        node(5004): sys.maxsize,
+    }
+
+    # the emulator decodes straight out of the packet
+    packet = b'L' + data
+    assert packets.decodeLinkState(memoryview(packet)[1:]) == packets.decodeLinkState(data)
+    assert packets.encodeLinkState([]) == b'' and packets.decodeLinkState(b'') == {}
@@ -0,0 +1,21 @@
+import random
+
+import pytest
+
+import pathcompute
+from test_spf import randomStore
+
+# both all pairs backends give the same tables
+# run with python -m pytest
+
+@pytest.mark.skipif(pathcompute.numpy is None, reason="the dense backend needs numpy")
+def test_dense_and_sparse_all_pairs_agree():
+    rand = random.Random(4)
+    for graph in range(50):
+        store = randomStore(rand, rand.randint(1, 40), rand.randint(1, 8))
+        sparse = pathcompute.allPairs(store, pathcompute.SPARSE)
+        dense = pathcompute.allPairs(store, pathcompute.DENSE)
+        for source in range(len(store)):
+            assert sparse.forwardTable(source) == dense.forwardTable(source)
+            for dest in range(len(store)):
+                assert sparse.distance(source, dest) == dense.distance(source, dest)
@@ -0,0 +1,76 @@
+import pytest
+
+import nodes
+import snapshot
+import topologystore
+
+# compiled snapshots load back as the text files they were compiled from
+# run with python -m pytest
+
+TOPOLOGY = """127.0.0.1,5001 127.0.0.1,5002,1 127.0.0.1,5003,4
+127.0.0.1,5002 127.0.0.1,5001,1 127.0.0.1,5003,1 127.0.0.1,5004,5
+
+127.0.0.1,5003 127.0.0.1,5001,4 127.0.0.1,5002,1 127.0.0.1,5004,1
+127.0.0.1,5004 127.0.0.1,5002,5 127.0.0.1,5003,1
+"""
+
+FORWARDING = """127.0.0.1 5002 127.0.0.1 5004 127.0.0.1 5003 20 5
+127.0.0.1 5001 127.0.0.1 5004 127.0.0.1 5002 10 0
+127.0.0.1 5001 127.0.0.1 5004 127.0.0.1 5003 30 50
+127.0.0.1 5001 127.0.0.1 5003 127.0.0.1 5003 0 100
+"""
+
+def node(port):
+    return nodes.internNode("127.0.0.1", port)
+
+def test_topology_round_trip(tmp_path):
+    textName = str(tmp_path / "topology.txt")
+    snapName = str(tmp_path / "topology.snap")
+    with open(textName, 'w') as textFile:
+        textFile.write(TOPOLOGY)
+
+    rows, digest = snapshot.compileFile(textName, snapName, snapshot.TOPOLOGY)
+
+    assert rows == 4
+    assert digest == snapshot.fileDigest(textName)
+    assert snapshot.isSnapshot(snapName) and not snapshot.isSnapshot(textName)
+    assert snapshot.readTopologyLinks(snapName, textName) == topologystore.readTopologyLinks(textName)
+
+def test_forwarding_round_trip(tmp_path):
+    textName = str(tmp_path / "forwarding.txt")
+    snapName = str(tmp_path / "forwarding.snap")
+    with open(textName, 'w') as textFile:
+        textFile.write(FORWARDING)
+
+    snapshot.compileFile(textName, snapName, snapshot.FORWARDING)
+
+    forwardingSnapshot = snapshot.Snapshot(snapName)
+    try:
+        assert forwardingSnapshot.forwardingTable(node(5001)) == {
+            node(5004): [(node(5002), 0.01, 0.0), (node(5003), 0.03, 0.5)],
+            node(5003): [(node(5003), 0.0, 1.0)],
+        }
+        assert forwardingSnapshot.forwardingTable(node(5002)) == {node(5004): [(node(5003), 0.02, 0.05)]}
+        assert forwardingSnapshot.forwardingTable(node(5009)) == {}
+    finally:
+        forwardingSnapshot.close()
+
+def test_stale_snapshot_is_refused(tmp_path):
+    textName = str(tmp_path / "topology.txt")
+    snapName = str(tmp_path / "topology.snap")
+    with open(textName, 'w') as textFile:
+        textFile.write(TOPOLOGY)
+    snapshot.compileFile(textName, snapName, snapshot.TOPOLOGY)
+
+    with open(textName, 'a') as textFile:
+        textFile.write("127.0.0.1,5005 127.0.0.1,5004,1\n")
+
+    with pytest.raises(ValueError):
+        snapshot.readTopologyLinks(snapName, textName)
+    assert len(snapshot.readTopologyLinks(snapName)) == 4
+
+def test_bad_lines_are_named(tmp_path):
+    with pytest.raises(ValueError, match="line 2"):
+        snapshot.compileTopology(["127.0.0.1,5001 127.0.0.1,5002,1", "127.0.0.1,5002 127.0.0.1,5001"])
+    with pytest.raises(ValueError, match="line 1"):
+        snapshot.compileForwarding(["127.0.0.1 5001 127.0.0.1 5004 127.0.0.1 5002 10 101"])
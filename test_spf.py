@@ -0,0 +1,59 @@
+import random
+import sys
+
+import nodes
+import spf
+import topologystore
+
+# random topologies repaired after link changes checked against full recomputes
+# run with python -m pytest
+
+GRAPHS = 3000
+
+# TopologyStore of n nodes with about degree links per node, some of them down
+# costs are 1 to 10 and not always the same both ways
+def randomStore(rand, n, degree):
+    ids = [nodes.internNode(f"10.0.{i >> 8}.{i & 255}", 3000) for i in range(n)]
+    links = {node: dict() for node in ids}
+    for i in range(n * degree // 2):
+        a, b = rand.randrange(n), rand.randrange(n)
+        if a == b:
+            continue
+        links[ids[a]][ids[b]] = rand.randint(1, 10)
+        links[ids[b]][ids[a]] = rand.randint(1, 10) if rand.random() < 0.3 else links[ids[a]][ids[b]]
+
+    store = topologystore.TopologyStore(list(links.items()))
+    for node in range(len(store)):
+        for next in store.neighbors(node):
+            if rand.random() < 0.1:
+                store.setLink(node, next, sys.maxsize)
+    return store
+
+# [(node, next)] of every slot in store
+def slots(store):
+    return [(node, next) for node in range(len(store)) for next in store.neighbors(node)]
+
+def test_repair_matches_full_recompute():
+    rand = random.Random(1)
+    for graph in range(GRAPHS):
+        store = randomStore(rand, rand.randint(2, 30), rand.randint(1, 5))
+        source = rand.randrange(len(store))
+        tree = spf.ShortestPathTree(store, source)
+        links = slots(store)
+        if not links:
+            continue
+
+        for change in range(10):
+            before = list(tree.firstHop)
+            changed = list()
+            for node, next in rand.sample(links, min(len(links), rand.randint(1, 3))):
+                cost = sys.maxsize if rand.random() < 0.4 else rand.randint(1, 10)
+                if store.setLink(node, next, cost):
+                    changed.append((node, next))
+
+            repaired = tree.linksChanged(changed)
+            dist, firstHop = spf.shortestPaths(store, source)
+
+            assert tree.dist == dist
+            assert tree.firstHop == firstHop
+            assert repaired == {node for node in range(len(store)) if before[node] != firstHop[node]}
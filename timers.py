@@ -0,0 +1,87 @@
+import heapq
+import itertools
+
+# timers kept in a min heap ordered by deadline (time.monotonic() seconds)
+# cancelled timers stay in the heap and are skipped when they come up (lazy deletion)
+class TimerHeap:
+    def __init__(self):
+        self.heap = list() # [[deadline, sequence number, callback, args]]
+        self.counter = itertools.count() # keeps timers with the same deadline in order
+
+    def __len__(self):
+        return len(self.heap)
+
+    # call callback(*args) once deadline has passed
+    # returns the timer so it can be cancelled
+    def schedule(self, deadline, callback, *args):
+        timer = [deadline, next(self.counter), callback, args]
+        heapq.heappush(self.heap, timer)
+        return timer
+
+    def cancel(self, timer):
+        timer[2] = None
+
+    # deadline of the next timer or None if there are none
+    def nextDeadline(self):
+        heap = self.heap
+        while heap and heap[0][2] is None:
+            heapq.heappop(heap)
+        if not heap:
+            return None
+        return heap[0][0]
+
+    # seconds to wait for the next timer from now (0 if one is overdue) or None if there are none
+    def timeout(self, now):
+        deadline = self.nextDeadline()
+        if deadline is None:
+            return None
+        return max(0, deadline - now)
+
+    # run every timer whose deadline is at or before now
+    # returns how many timers ran
+    def runDue(self, now):
+        heap = self.heap
+        ran = 0
+        while heap and heap[0][0] <= now:
+            timer = heapq.heappop(heap)
+            callback = timer[2]
+            if callback is None:
+                continue # cancelled
+            timer[2] = None
+            callback(*timer[3])
+            ran += 1
+        return ran
+
+# runs callback at most once per hold time, coalescing every request made while it waits
+# the hold starts at initial and doubles every run up to maximum (like OSPF's LSA and SPF throttles)
+# and goes back to initial once there have been no requests for maximum
+class Throttle:
+    def __init__(self, timerHeap, callback, initial, maximum):
+        self.timerHeap = timerHeap
+        self.callback = callback
+        self.initial = initial
+        self.maximum = maximum
+        self.hold = initial
+        self.lastRun = None # time of the last run or None if it has never run
+        self.timer = None # scheduled run or None
+
+    # ask for a run, returns the time it will happen
+    def request(self, now):
+        if self.timer is not None:
+            return self.timer[0] # already waiting, this request is coalesced into that run
+
+        if self.lastRun is None or now - self.lastRun > self.maximum:
+            self.hold = self.initial # quiet for long enough to start over
+
+        deadline = now + self.initial
+        if self.lastRun is not None:
+            deadline = max(deadline, self.lastRun + self.hold)
+
+        self.timer = self.timerHeap.schedule(deadline, self._run, deadline)
+        return deadline
+
+    def _run(self, deadline):
+        self.timer = None
+        self.lastRun = deadline
+        self.hold = min(self.hold * 2, self.maximum)
+        self.callback()
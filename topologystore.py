@@ -0,0 +1,119 @@
+import array
+import sys
+
+import nodes
+
+# cost given for a link that starts down (one that was never in the topology file)
+NO_LINK = 0xFFFFFFFF
+
+# compact store of every node and its links kept in flat arrays (compressed sparse rows)
+# node i has its links in slots offsets[i] to offsets[i + 1] of
+# targets (index of the node on the other end), costs (current cost) and up (1 if the link is up)
+# every link has a slot both ways so a link is never looked up in a dictionary
+class TopologyStore:
+    def __init__(self, links):
+        # links is [(node id, {next id: cost})] in the order nodes should be indexed
+        self.ids = array.array('Q') # node id of every index
+        self.index = dict() # {node id: index}
+
+        for node, nextLinks in links:
+            self._addIndex(node)
+        for node, nextLinks in links:
+            for next in nextLinks.keys():
+                self._addIndex(next)
+
+        # collect links of every node making sure the other direction exists too
+        rows = [dict() for i in range(len(self.ids))]
+        for node, nextLinks in links:
+            row = rows[self.index[node]]
+            for next, cost in nextLinks.items():
+                row[self.index[next]] = cost
+        for i, row in enumerate(rows):
+            for next in row.keys():
+                if next != i:
+                    rows[next].setdefault(i, NO_LINK)
+
+        self.offsets = array.array('I', [0])
+        self.targets = array.array('I')
+        self.costs = array.array('I')
+
+        for row in rows:
+            self.targets.extend(row.keys())
+            self.costs.extend(row.values())
+            self.offsets.append(len(self.targets))
+
+        self.up = bytearray(cost != NO_LINK for cost in self.costs)
+
+    def _addIndex(self, node):
+        if node not in self.index:
+            self.index[node] = len(self.ids)
+            self.ids.append(node)
+
+    def __len__(self):
+        return len(self.ids)
+
+    # slot of the link from node to next (both indexes) or -1 if there is none
+    def slot(self, node, next):
+        targets = self.targets
+        for e in range(self.offsets[node], self.offsets[node + 1]):
+            if targets[e] == next:
+                return e
+        return -1
+
+    # current cost of the link from node to next or sys.maxsize if it is down
+    def linkCost(self, node, next):
+        e = self.slot(node, next)
+        if e < 0 or not self.up[e]:
+            return sys.maxsize
+        return self.costs[e]
+
+    # set the link from node to next to cost, sys.maxsize takes it down
+    # returns True if the link changed
+    def setLink(self, node, next, cost):
+        e = self.slot(node, next)
+        if e < 0:
+            return False
+
+        if cost >= NO_LINK:
+            if not self.up[e]:
+                return False
+            self.up[e] = 0
+            return True
+
+        if self.up[e] and self.costs[e] == cost:
+            return False
+        self.up[e] = 1
+        self.costs[e] = cost
+        return True
+
+    # [next] of every node with a slot linking it to node
+    def neighbors(self, node):
+        return self.targets[self.offsets[node]:self.offsets[node + 1]].tolist()
+
+    # [(next, cost)] of every link of node that is up
+    def links(self, node):
+        up = list()
+        for e in range(self.offsets[node], self.offsets[node + 1]):
+            if self.up[e]:
+                up.append((self.targets[e], self.costs[e]))
+        return up
+
+# [(node, {next: cost})] of every line of a topology file
+# node format: ip,port  link format: ip,port,cost
+def readTopologyLinks(fileName):
+    links = list()
+
+    with open(fileName, 'r') as topologyFile:
+        for line in topologyFile:
+            lineNodes = line.split()
+            if not lineNodes:
+                continue
+
+            linksToAdd = dict()
+            for i in range(1, len(lineNodes)):
+                nodeKey = nodes.parseNode(lineNodes[i])
+                linksToAdd[nodeKey] = int(lineNodes[i].split(',')[2])
+
+            links.append((nodes.parseNode(lineNodes[0]), linksToAdd))
+
+    return links
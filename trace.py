@@ -3,6 +3,12 @@ import sys
 import socket
 import traceback
 import ipaddress
+import random
+import selectors
+from time import monotonic
+
+import packets
+import resolver
 
 parser = argparse.ArgumentParser(description="Network Emulator")
 
@@ -12,6 +18,10 @@ parser.add_argument("-c", "--source_port", type=int, required=True, dest="srcPor
 parser.add_argument("-d", "--destination_hostname", type=str, required=True, dest="destHost")
 parser.add_argument("-e", "--destination_port", type=int, required=True, dest="destPort")
 parser.add_argument("-f", "--debug_option", type=int, required=True, dest="debug")
+parser.add_argument("-H", "--hosts", type=str, default=None, dest="hostsName") # hosts style file to resolve names from
+parser.add_argument("-w", "--window", type=int, default=20, dest="window") # probes out at once, 1 traces one hop at a time
+parser.add_argument("-t", "--timeout", type=float, default=1.0, dest="timeout") # seconds to wait for each probe
+parser.add_argument("-r", "--retries", type=int, default=2, dest="retries") # times a probe is sent again before giving up on its hop
 
 args = parser.parse_args()
 
@@ -19,33 +29,38 @@ args = parser.parse_args()
 if 2049 > args.rtPort or args.rtPort > 65536:
     print("Routetrace port out of range.")
     sys.exit()
+if args.window < 1:
+    print("Window must be at least 1.")
+    sys.exit()
 
 # open port (to listen on only?)
 hostname = socket.gethostname()
-ipAddr = socket.gethostbyname(hostname)
+
+# names from the hosts file are never looked up
+try:
+    if args.hostsName is not None:
+        resolver.loadHosts(args.hostsName)
+    addrs = resolver.resolveAll([hostname, args.srcHost, args.destHost])
+except:
+    print("An error occured resolving host names")
+    print(traceback.format_exc())
+    sys.exit()
+ipAddr = addrs[hostname]
 
 # get addresses
 hostAddr = (ipaddress.ip_address(ipAddr), args.rtPort)
-srcAddr = (ipaddress.ip_address(socket.gethostbyname(args.srcHost)), args.srcPort)
-destAddr = (ipaddress.ip_address(socket.gethostbyname(args.destHost)), args.destPort)
-
-# make the first bytes of the packet
-# route trace packet format: type 1B, srcIP 4B, srcPort 2B, destIP 4B, destPort 2B, senderIP 4B, senderPort 2B, TTL 4B
-# get src and dest pairs
-pType = ord('T').to_bytes(1, 'big')
-srcIP = socket.htonl(int(srcAddr[0])).to_bytes(4, 'big')
-srcPort = socket.htons(srcAddr[1]).to_bytes(2, 'big')
-destIP = socket.htonl(int(destAddr[0])).to_bytes(4, 'big')
-destPort = socket.htons(destAddr[1]).to_bytes(2, 'big')
-senderIP = socket.htonl(int(hostAddr[0])).to_bytes(4, 'big')
-senderPort = socket.htons(hostAddr[1]).to_bytes(2, 'big')
-packetStart = pType + srcIP + srcPort + destIP + destPort + senderIP + senderPort
+srcAddr = (ipaddress.ip_address(addrs[args.srcHost]), args.srcPort)
+destAddr = (ipaddress.ip_address(addrs[args.destHost]), args.destPort)
+
+# make the packet, TTL and probeId are rewritten in place for every packet sent
+# route trace packet format: type 1B, srcIP 4B, srcPort 2B, destIP 4B, destPort 2B, senderIP 4B, senderPort 2B, TTL 4B, probeId 4B
+rTPacket = bytearray(packets.ROUTE_TRACE.pack(ord('T'), int(srcAddr[0]), srcAddr[1], int(destAddr[0]), destAddr[1], int(hostAddr[0]), hostAddr[1], 0) + packets.PROBE.pack(0))
 
 # open socket
 try:
     recSoc = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     recSoc.bind((str(hostAddr[0]), hostAddr[1]))
-    recSoc.setblocking(True)
+    recSoc.setblocking(0)
 except:
     print("An error occured binding the socket")
     print(traceback.format_exc())
@@ -54,38 +69,66 @@ except:
 # socket to send from (not the same one)
 sendSoc = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
-def routetrace():
-    if args.debug == 0:
-        print("Hop#  IP Port")
-    else:
-        print("Hop# SRCIP SRCPort DESTIP DESTPort")
+maxHops = 20 # at most 20 nodes
 
-    for tTL in range(20): # at most 20 nodes
-        # send new packet
-        sendRTPacket(tTL)
-        
-        # wait for response
-        try:
-            # try to recieve packet and handle it
-            data, addr = recSoc.recvfrom(4096)
-            
-            handlePacket(data, tTL)
-        except BlockingIOError:
-            pass # Not sure what happened
-        except KeyboardInterrupt:
-            sys.exit()
-        except SystemExit:
-            sys.exit()
-        except:
-            print("Something went wrong when listening for or interacting with packet.")
-            print(traceback.format_exc())
+# wait on the socket until a reply comes in or the next probe times out
+selector = selectors.DefaultSelector()
+selector.register(recSoc, selectors.EVENT_READ)
+
+# probes sent and not answered yet {probeId: (tTL, time sent, times sent)}
+# ids start somewhere random so replies to an earlier trace on the same port are not matched
+outstanding = dict()
+nextProbeId = random.getrandbits(32)
+
+# (srcP, destP, rtt in seconds) of every hop that answered by tTL or False if it never did
+hops = [None] * maxHops
 
+# hops past the destination are not traced
+hopLimit = maxHops
 
-# send the traceroute packet with specified time to live
-def sendRTPacket(tTL):
-    packet = packetStart + socket.htonl(tTL).to_bytes(4, 'big')
+# trace every hop with up to args.window probes out at once
+# every probe has its own id that comes back in the reply so replies can come in any order
+# with a window of 1 this is the same as tracing one hop at a time
+def routetrace():
+    if args.debug == 0:
+        print("Hop#  IP Port  RTT")
+    else:
+        print("Hop# SRCIP SRCPort DESTIP DESTPort RTT")
+
+    nextTTL = 0 # next hop without a probe
+    nextToPrint = 0
+
+    while nextToPrint < hopLimit:
+        # fill the window
+        while len(outstanding) < args.window and nextTTL < hopLimit:
+            sendRTPacket(nextTTL, 1)
+            nextTTL += 1
+
+        # wait for the probe that times out first
+        now = monotonic()
+        deadline = min(sent + args.timeout for tTL, sent, tries in outstanding.values())
+        if selector.select(max(0.0, deadline - now)):
+            recieveReplies()
+        else:
+            retryProbes(monotonic())
+
+        # print hops in order as soon as they are known
+        while nextToPrint < hopLimit and hops[nextToPrint] is not None:
+            printHop(nextToPrint)
+            nextToPrint += 1
+
+# send the traceroute packet with specified time to live as a new probe
+def sendRTPacket(tTL, tries):
+    global nextProbeId
+
+    probeId = nextProbeId
+    nextProbeId = (nextProbeId + 1) & 0xFFFFFFFF
+
+    packets.rewriteRouteTrace(rTPacket, tTL)
+    packets.rewriteRouteTraceProbe(rTPacket, probeId)
     src = (str(srcAddr[0]), srcAddr[1])
-    sendSoc.sendto(packet, src)
+    outstanding[probeId] = (tTL, monotonic(), tries)
+    sendSoc.sendto(rTPacket, src)
 
     # print packet information
     srcP = (str(srcAddr[0]), srcAddr[1])
@@ -95,33 +138,78 @@ def sendRTPacket(tTL):
         print("ROUTETRACE PACKET SENT:")
         print(f"{tTL+1} {srcP[0]}, {srcP[1]} {destP[0]}, {destP[1]}")
 
+# send probes that timed out again or give up on their hop
+def retryProbes(now):
+    for probeId, (tTL, sent, tries) in list(outstanding.items()):
+        if sent + args.timeout > now:
+            continue
+        del outstanding[probeId]
+        if tTL >= hopLimit or hops[tTL] is not None:
+            continue
+        if tries > args.retries:
+            hops[tTL] = False
+        else:
+            sendRTPacket(tTL, tries + 1)
+
+# handle every reply waiting on the socket
+def recieveReplies():
+    while True:
+        try:
+            data, addr = recSoc.recvfrom(4096)
+        except BlockingIOError:
+            return # socket is empty
+        try:
+            handlePacket(data, monotonic())
+        except:
+            print("Something went wrong when listening for or interacting with packet.")
+            print(traceback.format_exc())
 
+# handles packets and stores the hop they answer for
+def handlePacket(data, now):
+    global hopLimit
 
-# handles packets and prints if needed
-def handlePacket(data, tTL):
     if data[0] != 79:
         return # wrong packet type
-    
-    # print responders IP and port
+
+    # match the reply to its probe
+    # emulators that do not send probe ids back can only be matched when one probe is out
+    probeId = packets.routeTraceProbe(data)
+    if probeId is None and len(outstanding) == 1:
+        probeId = next(iter(outstanding))
+    probe = outstanding.pop(probeId, None)
+    if probe is None:
+        return # late reply to a probe that was already sent again
+    tTL, sent, tries = probe
+
     # get destination and source addresses
-    srcIP = socket.ntohl(int.from_bytes(data[1:5], 'big'))
-    srcPort = socket.ntohs(int.from_bytes(data[5:7], 'big'))
+    pType, srcIP, srcPort, destIP, destPort = packets.ROUTE_TRACE.unpack_from(data)[:5]
     srcKey = (ipaddress.ip_address(srcIP), srcPort)
     srcP = (str(ipaddress.ip_address(srcIP)), srcPort)
 
-    destIP = socket.ntohl(int.from_bytes(data[7:11], 'big'))
-    destPort = socket.ntohs(int.from_bytes(data[11:13], 'big'))
     destP = (str(ipaddress.ip_address(destIP)), destPort)
 
+    if tTL < hopLimit and not hops[tTL]:
+        hops[tTL] = (srcP, destP, now - sent)
+
+    # determine if responder is destination address if so nothing past it is traced
+    if srcKey == destAddr and tTL + 1 < hopLimit:
+        hopLimit = tTL + 1
+        for probeId in [probeId for probeId, probe in outstanding.items() if probe[0] >= hopLimit]:
+            del outstanding[probeId]
+
+# print a hop that answered or gave up
+def printHop(tTL):
+    hop = hops[tTL]
+    if not hop:
+        print(f"{tTL+1} *")
+        return
+
+    srcP, destP, rtt = hop
     if args.debug == 0:
-        print(f"{tTL+1} {srcP[0]}, {srcP[1]}")
+        print(f"{tTL+1} {srcP[0]}, {srcP[1]} {rtt * 1000:.2f} ms")
     else:
         print("RETURN PACKET RECIEVED:")
-        print(f"{tTL+1} {srcP[0]}, {srcP[1]} {destP[0]}, {destP[1]}")
-    # determine if responder is destination address if so exit
-
-    if (srcKey == destAddr):
-        sys.exit()
+        print(f"{tTL+1} {srcP[0]}, {srcP[1]} {destP[0]}, {destP[1]} {rtt * 1000:.2f} ms")
 
 
 def cleanup():
@@ -134,6 +222,3 @@ def main():
 
 if __name__ == '__main__':
     main()
-
-# 
-# type: ignore